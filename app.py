@@ -3,305 +3,140 @@ import pandas as pd
 from datetime import datetime, date
 import firebase_admin
 from firebase_admin import credentials, firestore
+import cProfile
 import math
-import re
+import os
+from collections import OrderedDict
+from rate_core import (
+    ALL_ROOMS, DYNAMIC_ROOMS, RATE_TABLE_CSS, PACE_PICKUP_DAYS,
+    build_rate_grid, compute_change_set, sell_price_matrix, export_sell_prices,
+    render_master_table, frame_fingerprint, render_cache_key, get_cached_html,
+    parse_reports, upload_key, upsert_rows, encode_snapshot, decode_snapshot,
+    build_pace_cube, pickup_curves, n_day_pickup, bar_history,
+)
+from rate_store import FirestoreStore, SQLiteStore, CachedStore, StoreMeter, new_snapshot_id
+from rate_diag import RunTrace, meter_stats, store_delta, append_diag_log, profile_report
 
 # --- 1. 파이버베이스 초기화 ---
-if not firebase_admin._apps:
-    try:
-        fb_dict = st.secrets["firebase"]
-        cred = credentials.Certificate(dict(fb_dict))
-        firebase_admin.initialize_app(cred)
-    except Exception as e:
-        st.error(f"파이어베이스 연결 실패: {e}")
-db = firestore.client()
-
-# --- 2. 전역 설정 데이터 ---
-BAR_GRADIENT_COLORS = {
-    "BAR1": "#D32F2F", "BAR2": "#EF5350", "BAR3": "#FF8A65", "BAR4": "#FFB199",
-    "BAR5": "#81C784", "BAR6": "#A5D6A7", "BAR7": "#C8E6C9", "BAR8": "#E8F5E9",
-}
-BAR_LIGHT_COLORS = {
-    "BAR1": "#FFEBEE", "BAR2": "#FFEBEE", "BAR3": "#FFF3E0", "BAR4": "#FFF3E0",
-    "BAR5": "#E8F5E9", "BAR6": "#E8F5E9", "BAR7": "#F1F8E9", "BAR8": "#F1F8E9",
-}
-WEEKDAYS_KR = ['월', '화', '수', '목', '금', '토', '일']
-DYNAMIC_ROOMS = ["FDB", "FDE", "HDP", "HDT", "HDF"]
-FIXED_ROOMS = ["GDB", "GDF", "FFD", "FPT", "PPV"]
-ALL_ROOMS = DYNAMIC_ROOMS + FIXED_ROOMS
-
-PRICE_TABLE = {
-    "FDB": {"BAR8": 315000, "BAR7": 353000, "BAR6": 396000, "BAR5": 445000, "BAR4": 502000, "BAR3": 567000, "BAR2": 642000, "BAR1": 728000},
-    "FDE": {"BAR8": 352000, "BAR7": 390000, "BAR6": 433000, "BAR5": 482000, "BAR4": 539000, "BAR3": 604000, "BAR2": 679000, "BAR1": 765000},
-    "HDP": {"BAR8": 250000, "BAR7": 288000, "BAR6": 331000, "BAR5": 380000, "BAR4": 437000, "BAR3": 502000, "BAR2": 577000, "BAR1": 663000},
-    "HDT": {"BAR8": 250000, "BAR7": 288000, "BAR6": 331000, "BAR5": 380000, "BAR4": 437000, "BAR3": 502000, "BAR2": 577000, "BAR1": 663000},
-    "HDF": {"BAR8": 420000, "BAR7": 458000, "BAR6": 501000, "BAR5": 550000, "BAR4": 607000, "BAR3": 672000, "BAR2": 747000, "BAR1": 833000},
-}
-FIXED_PRICE_TABLE = {
-    "GDB": {"UND1": 180000, "UND2": 180000, "MID1": 225000, "MID2": 225000, "UPP1": 285000, "UPP2": 315000},
-    "GDF": {"UND1": 375000, "UND2": 375000, "MID1": 410000, "MID2": 410000, "UPP1": 488000, "UPP2": 488000},
-    "FFD": {"UND1": 353000, "UND2": 353000, "MID1": 445000, "MID2": 445000, "UPP1": 567000, "UPP2": 567000},
-    "FPT": {"UND1": 500000, "UND2": 550000, "MID1": 600000, "MID2": 650000, "UPP1": 700000, "UPP2": 750000},
-    "PPV": {"UND1": 1100000, "UND2": 1100000, "MID1": 1250000, "MID2": 1250000, "UPP1": 1400000, "UPP2": 1400000},
-}
-
-# --- 3. 로직 함수 ---
-def get_season_details(date_obj):
-    m, d = date_obj.month, date_obj.day
-    md = f"{m:02d}.{d:02d}"
-    actual_is_weekend = date_obj.weekday() in [4, 5]
-    if ("02.13" <= md <= "02.18") or ("09.23" <= md <= "09.28"):
-        season, is_weekend = "UPP", True
-    elif ("12.21" <= md <= "12.31") or ("10.01" <= md <= "10.08"):
-        season, is_weekend = "UPP", False
-    elif ("05.03" <= md <= "05.05") or ("05.24" <= md <= "05.26") or ("06.05" <= md <= "06.07"):
-        season, is_weekend = "MID", True
-    elif "07.17" <= md <= "08.29":
-        season, is_weekend = "UPP", actual_is_weekend
-    elif ("01.04" <= md <= "03.31") or ("11.01" <= md <= "12.20"):
-        season, is_weekend = "UND", actual_is_weekend
-    else:
-        season, is_weekend = "MID", actual_is_weekend
-    type_code = f"{season}{'2' if is_weekend else '1'}"
-    return type_code, season, is_weekend
-
-def determine_bar(season, is_weekend, occ):
-    if season == "UPP":
-        if is_weekend:
-            if occ >= 81: return "BAR1"
-            elif occ >= 51: return "BAR2"
-            elif occ >= 31: return "BAR3"
-            else: return "BAR4"
-        else:
-            if occ >= 81: return "BAR2"
-            elif occ >= 51: return "BAR3"
-            elif occ >= 31: return "BAR4"
-            else: return "BAR5"
-    elif season == "MID":
-        if is_weekend:
-            if occ >= 81: return "BAR3"
-            elif occ >= 51: return "BAR4"
-            elif occ >= 31: return "BAR5"
-            else: return "BAR6"
-        else:
-            if occ >= 81: return "BAR4"
-            elif occ >= 51: return "BAR5"
-            elif occ >= 31: return "BAR6"
-            else: return "BAR7"
-    else: # UND
-        if is_weekend:
-            if occ >= 81: return "BAR4"
-            elif occ >= 51: return "BAR5"
-            elif occ >= 31: return "BAR6"
-            else: return "BAR7"
-        else:
-            if occ >= 81: return "BAR5"
-            elif occ >= 51: return "BAR6"
-            elif occ >= 31: return "BAR7"
-            else: return "BAR8"
-
-def get_final_values(room_id, date_obj, avail, total):
-    type_code, season, is_weekend = get_season_details(date_obj)
-    try: current_avail = float(avail) if pd.notna(avail) else 0.0
-    except: current_avail = 0.0
-    occ = ((total - current_avail) / total * 100) if total > 0 else 0
-    if room_id in DYNAMIC_ROOMS:
-        bar = determine_bar(season, is_weekend, occ)
-        price = PRICE_TABLE.get(room_id, {}).get(bar, 0)
-    else:
-        bar = type_code
-        price = FIXED_PRICE_TABLE.get(room_id, {}).get(type_code, 0)
-    return occ, bar, price
-
-# --- 4. 렌더러 ---
-def render_master_table(current_df, prev_df, ch_name=None, title="", mode="기준"):
-    if current_df.empty: return "<div style='padding:20px;'>데이터를 업로드하세요.</div>"
-    dates = sorted(current_df['Date'].unique())
-    
-    if mode == "판매가":
-        items_to_show = st.session_state.promotions.get(ch_name, {}).get("items", [])
-        row_padding = "1px"
-        header_padding = "2px"
-        line_style = "line-height: 1.0; font-size: 11px;"
-        font_size = "11px"
-        col_width_style = "min-width: 45px;"
-    else:
-        items_to_show = ALL_ROOMS
-        row_padding = "8px"
-        header_padding = "5px"
-        line_style = ""
-        font_size = "11px"
-        col_width_style = ""
-
-    if mode == "판매가" and not items_to_show:
-        return f"<div style='padding:10px; color:gray;'>👉 사이드바에서 {ch_name} 상품을 추가해주세요.</div>"
-
-    html = f"<div style='margin-top:40px; margin-bottom:10px; font-weight:bold; font-size:18px; padding:10px; background:#f0f2f6; border-left:10px solid #000;'>{title}</div>"
-    html += "<div style='overflow-x: auto; white-space: nowrap; border: 1px solid #ddd;'>"
-    html += f"<table style='width:100%; border-collapse:collapse; font-size:{font_size}; min-width:1000px;'><thead><tr style='background:#f9f9f9;'><th rowspan='2' style='border:1px solid #ddd; width:180px; position:sticky; left:0; background:#f9f9f9; z-index:2; padding:{header_padding};'>객실/프로모션</th>"
-    for d in dates: html += f"<th style='border:1px solid #ddd; padding:{header_padding}; {col_width_style}'>{d.strftime('%m-%d')}</th>"
-    html += "</tr><tr style='background:#f9f9f9;'>"
-    for d in dates:
-        wd = WEEKDAYS_KR[d.weekday()]
-        color = "red" if wd=='일' else ("blue" if wd=='토' else "black")
-        html += f"<th style='border:1px solid #ddd; padding:{header_padding}; color:{color}; {col_width_style}'>{wd}</th>"
-    html += "</tr></thead><tbody>"
-
-    for item in items_to_show:
-        if mode == "판매가":
-            rid = item.get('객실타입', 'Unknown')
-            label_text = item.get('상품명', 'No Name')
-            label = f"<b>{rid}</b> <span style='color:blue; margin-left:4px;'>: {label_text}</span>"
-            try: discount = float(item.get('할인(%)') or 0)
-            except: discount = 0.0
-            try: add_price = int(item.get('추가금') or 0)
-            except: add_price = 0
-        else:
-            rid = item
-            label = rid
-            if rid in ["HDF", "PPV"]: label = f"<b>{rid}</b>"
+@st.cache_resource
+def get_db():
+    # 클라이언트는 프로세스 단위로 한 번만 생성해 모든 세션/리런이 공유
+    if not firebase_admin._apps:
+        try:
+            fb_dict = st.secrets["firebase"]
+            cred = credentials.Certificate(dict(fb_dict))
+            firebase_admin.initialize_app(cred)
+        except Exception as e:
+            st.error(f"파이어베이스 연결 실패: {e}")
+    return firestore.client()
 
-        border_thick = "border-bottom:3.4px solid #000;" if rid in ["HDF", "PPV"] else ""
-        html += f"<tr style='{border_thick}'><td style='border:1px solid #ddd; padding:{row_padding}; background:#fff; border-right:4px solid #000; position:sticky; left:0; z-index:1; {line_style}'>{label}</td>"
-        
-        for d in dates:
-            curr_match = current_df[(current_df['RoomID'] == rid) & (current_df['Date'] == d)]
-            if curr_match.empty:
-                html += f"<td style='border:1px solid #ddd; padding:{row_padding}; text-align:center;'>-</td>"
-                continue
-
-            avail = curr_match.iloc[0]['Available']
-            total = curr_match.iloc[0]['Total']
-            occ, bar, base_price = get_final_values(rid, d, avail, total)
-            
-            prev_bar, prev_avail = None, None
-            if not prev_df.empty:
-                prev_m = prev_df[(prev_df['RoomID'] == rid) & (prev_df['Date'] == d)]
-                if not prev_m.empty:
-                    prev_avail = prev_m.iloc[0]['Available']
-                    _, prev_bar, _ = get_final_values(rid, d, prev_avail, prev_m.iloc[0]['Total'])
-
-            style = f"border:1px solid #ddd; padding:{row_padding}; text-align:center; background-color:white; {line_style}"
-            
-            if mode == "기준":
-                bg = BAR_GRADIENT_COLORS.get(bar, "#FFFFFF") if rid in DYNAMIC_ROOMS else "#F1F1F1"
-                style += f"background-color: {bg};"
-                content = f"<b>{bar}</b><br>{base_price:,}<br>{occ:.0f}%"
-            
-            elif mode == "변화":
-                curr_av_safe = float(avail) if pd.notna(avail) else 0.0
-                prev_av_safe = float(prev_avail) if (prev_avail is not None and pd.notna(prev_avail)) else 0.0
-                pickup = (prev_av_safe - curr_av_safe) if prev_avail is not None else 0
-                bg = BAR_LIGHT_COLORS.get(bar, "#FFFFFF") if rid in DYNAMIC_ROOMS else "#FFFFFF"
-                style += f"background-color: {bg};"
-                if pickup > 0:
-                    style += "color:red; font-weight:bold; border: 1.5px solid red;"
-                    content = f"+{pickup:.0f}"
-                elif pickup < 0:
-                    style += "color:blue; font-weight:bold;"
-                    content = f"{pickup:.0f}"
-                else: content = "-"
-            
-            elif mode == "판도변화":
-                # [판도 변화 로직 강화] 공백 제거 및 엄격 비교
-                curr_b_str = str(bar).strip() if bar else ""
-                prev_b_str = str(prev_bar).strip() if prev_bar else ""
-                
-                # 이전 데이터가 있고, 값이 다를 때만 색칠
-                if prev_bar is not None and prev_b_str != curr_b_str:
-                    bg = BAR_GRADIENT_COLORS.get(bar, "#7000FF")
-                    style += f"background-color: {bg}; color: white; font-weight: bold; border: 2.5px solid #000;"
-                    content = f"▲ {bar}"
-                else: 
-                    # 같으면 흰색 유지
-                    content = bar
-            
-            elif mode == "판매가":
-                after_disc = base_price * (1 - (discount / 100))
-                final_p = int((math.floor(after_disc / 1000) * 1000) + add_price)
-                content = f"<b>{final_p:,}</b>"
-                
-                curr_b_str = str(bar).strip() if bar else ""
-                prev_b_str = str(prev_bar).strip() if prev_bar else ""
-                
-                if prev_bar is not None and prev_b_str != curr_b_str:
-                    bg = BAR_GRADIENT_COLORS.get(bar, "#7000FF")
-                    style += f"background-color: {bg}; color: white; font-weight: bold; border: 2.5px solid #333;"
-
-            html += f"<td style='{style}'>{content}</td>"
-        html += "</tr>"
-    html += "</tbody></table></div>"
-    return html
-
-# --- 5. 파서 및 DB 로직 ---
-def robust_date_parser(d_val):
-    if pd.isna(d_val): return None
-    try:
-        if isinstance(d_val, (int, float)): return (pd.to_datetime('1899-12-30') + pd.to_timedelta(d_val, 'D')).date()
-        s = str(d_val).strip().replace('.', '-').replace('/', '-').replace(' ', '')
-        match = re.search(r'(\d{1,2})-(\d{1,2})', s)
-        if match: return date(2026, int(match.group(1)), int(match.group(2)))
-    except: pass
-    return None
+CONFIG_CACHE_TTL = 300    # settings/channels 캐시 (초)
+SNAPSHOT_CACHE_TTL = 60   # 최신 daily_snapshots 캐시 (초)
+SNAPSHOT_CACHE_ENTRIES = 32   # prev_ref 로 참조되는 과거 스냅샷 메모리 캐시 개수
+# 저장소 선택: firestore / sqlite / cached (Firestore 앞에 로컬 SQLite 캐시 + write-behind)
+STORE_BACKEND = os.environ.get("RATE_STORE", "cached")
+SQLITE_PATH = os.environ.get("RATE_STORE_PATH", "purehill_rate.sqlite3")
+# 리런별 단계 시간/저장소 호출 기록 (JSON 줄, 크기 제한으로 회전)
+DIAG_LOG_PATH = os.environ.get("RATE_DIAG_LOG", "purehill_diag.log")
+
+WINDOW_CHOICES = [14, 31, 62, 92, "전체"]
+DEFAULT_WINDOW_DAYS = 31
+PACE_SNAPSHOTS = 30
+
+# --- 2. 저장소 연결 및 캐시 ---
+@st.cache_resource
+def get_store():
+    # 백엔드마다 StoreMeter 로 감싸 진단 패널에서 호출 수/지연을 봄 (cached 는 Firestore 와 로컬 캐시를 따로 집계)
+    if STORE_BACKEND == "sqlite": return StoreMeter(SQLiteStore(SQLITE_PATH), "sqlite")
+    primary = StoreMeter(FirestoreStore(get_db()), "firestore")
+    if STORE_BACKEND == "firestore": return primary
+    return CachedStore(primary, StoreMeter(SQLiteStore(SQLITE_PATH), "sqlite"))
 
 def save_channel_configs():
-    db.collection("settings").document("channels").set({"channel_list": st.session_state.channel_list, "promotions": st.session_state.promotions})
+    get_store().save_channel_configs({"channel_list": st.session_state.channel_list, "promotions": st.session_state.promotions})
+    fetch_channel_configs.clear()
+
+@st.cache_data(ttl=CONFIG_CACHE_TTL, show_spinner=False)
+def fetch_channel_configs():
+    return get_store().load_channel_configs()
 
 def load_channel_configs():
-    doc = db.collection("settings").document("channels").get()
-    if doc.exists:
-        d = doc.to_dict()
-        st.session_state.channel_list = d.get("channel_list", [])
-        st.session_state.promotions = d.get("promotions", {})
-    else:
-        st.session_state.channel_list = []
-        st.session_state.promotions = {}
+    # cache_data 는 호출마다 복사본을 돌려주므로 세션에서 바로 수정해도 안전
+    d = fetch_channel_configs()
+    st.session_state.channel_list = d.get("channel_list", [])
+    st.session_state.promotions = d.get("promotions", {})
 
+@st.cache_data(ttl=SNAPSHOT_CACHE_TTL, show_spinner=False)
 def get_latest_snapshot():
-    docs = db.collection("daily_snapshots").order_by("save_time", direction=firestore.Query.DESCENDING).limit(1).stream()
-    for doc in docs:
-        d_dict = doc.to_dict()
-        df = pd.DataFrame(d_dict['data'])
-        if not df.empty and 'Date' in df.columns:
-            df['Date'] = pd.to_datetime(df['Date']).dt.date
-        return df, d_dict.get('work_date', '알수없음')
-    return pd.DataFrame(), None
-
-# --- 6. 메인 UI ---
+    store = get_store()
+    ref = store.latest_snapshot_ref()
+    d_dict = store.load_snapshot(ref[0]) if ref else None
+    if d_dict is None: return pd.DataFrame(), None, None
+    df, _ = decode_snapshot(d_dict, with_prev=False)
+    return df, d_dict.get('work_date', '알수없음'), ref[0]
+
+@st.cache_data(show_spinner=False, max_entries=SNAPSHOT_CACHE_ENTRIES)
+def load_snapshot_data(doc_id):
+    # prev_ref 로 참조되는 과거 스냅샷은 바뀌지 않으므로 TTL 없이 캐시 (개수 제한, 밀려난 것은 로컬 SQLite 에서 다시 읽음)
+    d_dict = get_store().load_snapshot(doc_id)
+    if d_dict is None: return pd.DataFrame()
+    df, _ = decode_snapshot(d_dict, with_prev=False)
+    return df
+
+@st.cache_data(ttl=SNAPSHOT_CACHE_TTL, show_spinner=False)
+def load_pace_cube(n):
+    # 목록은 projection 쿼리 1회, 본문은 일괄 조회 (CachedStore 면 한 번 받은 과거 스냅샷은 로컬에서 읽음)
+    store = get_store()
+    refs = list(reversed(store.recent_snapshot_refs(n)))
+    docs = store.load_snapshots([r[0] for r in refs])
+    pairs = [(r, d) for r, d in zip(refs, docs) if d is not None]
+    return build_pace_cube([r for r, _ in pairs], [d for _, d in pairs])
+
+# --- 3. 메인 UI ---
 st.set_page_config(layout="wide")
 st.title("🏨 엠버퓨어힐 전략 통합 수익관리 시스템")
 
-if 'channel_list' not in st.session_state: load_channel_configs()
+# 리런 진단: 단계별 span + 저장소 호출 누적값의 차이, 요청 시 이번 리런 전체를 cProfile 로 캡처
+trace = RunTrace()
+store_before = meter_stats(get_store())
+stale = st.session_state.pop("profiler", None)
+if stale: stale.disable()   # st.rerun 등으로 끝까지 못 간 캡처
+if st.session_state.pop("profile_next", False):
+    st.session_state.profiler = cProfile.Profile()
+    st.session_state.profiler.enable()
+
+if 'channel_list' not in st.session_state:
+    with trace.span("configs"): load_channel_configs()
 if 'today_df' not in st.session_state: st.session_state.today_df = pd.DataFrame()
 if 'prev_df' not in st.session_state: st.session_state.prev_df = pd.DataFrame()
 if 'compare_label' not in st.session_state: st.session_state.compare_label = ""
+if 'prev_ref' not in st.session_state: st.session_state.prev_ref = None
+if 'render_cache' not in st.session_state: st.session_state.render_cache = OrderedDict()
+if 'parsed_uploads' not in st.session_state: st.session_state.parsed_uploads = {}
+if 'applied_uploads' not in st.session_state: st.session_state.applied_uploads = set()
 
 with st.sidebar:
     st.header("📅 수정 내역 조회 (History)")
     work_day = st.date_input("조회 날짜", value=date.today())
     if st.button("📂 과거 기록 불러오기"):
-        docs = db.collection("daily_snapshots").where("work_date", "==", work_day.strftime("%Y-%m-%d")).limit(1).stream()
-        found = False
-        for doc in docs:
-            d_dict = doc.to_dict()
-            st.session_state.today_df = pd.DataFrame(d_dict['data'])
-            if not st.session_state.today_df.empty and 'Date' in st.session_state.today_df.columns:
-                st.session_state.today_df['Date'] = pd.to_datetime(st.session_state.today_df['Date']).dt.date
-            
-            if 'prev_data' in d_dict and d_dict['prev_data']:
-                st.session_state.prev_df = pd.DataFrame(d_dict['prev_data'])
-                if not st.session_state.prev_df.empty and 'Date' in st.session_state.prev_df.columns:
-                    st.session_state.prev_df['Date'] = pd.to_datetime(st.session_state.prev_df['Date']).dt.date
-            else:
-                st.session_state.prev_df = pd.DataFrame()
+        store = get_store()
+        with trace.span("history_load") as span:
+            doc_id = store.find_snapshot_id(work_day.strftime("%Y-%m-%d"))
+            d_dict = store.load_snapshot(doc_id) if doc_id else None
+            if d_dict is not None:
+                st.session_state.today_df, st.session_state.prev_df = decode_snapshot(d_dict, resolve_ref=load_snapshot_data)
+                span["rows"] = len(st.session_state.today_df) + len(st.session_state.prev_df)
+        if d_dict is not None:
+            st.session_state.prev_ref = d_dict.get('prev_ref')
 
             if 'saved_promotions' in d_dict:
                 st.session_state.promotions = d_dict['saved_promotions']
                 st.session_state.channel_list = d_dict.get('saved_channel_list', [])
             
             st.session_state.compare_label = f"불러온 과거 기록: {work_day}"
-            found = True
-        if found: st.success("역사적 스냅샷 로드 완료")
+            # 불러온 기록 위에 첨부 파일을 다시 덮어쓰도록 적용 이력 초기화
+            st.session_state.applied_uploads = set()
+            st.success("역사적 스냅샷 로드 완료")
         else: st.warning("데이터 없음")
 
     st.divider()
@@ -350,71 +185,196 @@ with st.sidebar:
     files = st.file_uploader("리포트 업로드 (부분 수정 가능)", accept_multiple_files=True)
     if st.button("🚀 오늘 내역 저장"):
         if not st.session_state.today_df.empty:
-            t_df = st.session_state.today_df.copy()
-            t_df['Date'] = t_df['Date'].apply(lambda x: x.isoformat())
-            p_df_dict = []
-            if not st.session_state.prev_df.empty:
-                p_df = st.session_state.prev_df.copy()
-                p_df['Date'] = p_df['Date'].apply(lambda x: x.isoformat())
-                p_df_dict = p_df.to_dict(orient='records')
-            db.collection("daily_snapshots").add({
-                "work_date": date.today().strftime("%Y-%m-%d"),
-                "save_time": datetime.now().isoformat(),
-                "data": t_df.to_dict(orient='records'),
-                "prev_data": p_df_dict,
-                "saved_promotions": st.session_state.promotions,
-                "saved_channel_list": st.session_state.channel_list
-            })
+            with trace.span("save_snapshot", rows=len(st.session_state.today_df)):
+                # prev 가 DB 최신 스냅샷 그대로면 복사 대신 문서 참조만 저장
+                snapshot = encode_snapshot(st.session_state.today_df, st.session_state.prev_df, prev_ref=st.session_state.prev_ref)
+                get_store().save_snapshot(new_snapshot_id(), {
+                    "work_date": date.today().strftime("%Y-%m-%d"),
+                    "save_time": datetime.now().isoformat(),
+                    **snapshot,
+                    "saved_promotions": st.session_state.promotions,
+                    "saved_channel_list": st.session_state.channel_list
+                })
+            get_latest_snapshot.clear()
+            load_pace_cube.clear()
             st.success("저장 완료!")
+    for err in get_store().drain_errors(): st.warning(f"백그라운드 저장 실패: {err}")
 
-# --- 7. 파일 로직 (스마트 병합) ---
+# --- 4. 파일 로직 (스마트 병합) ---
 if files:
-    new_extracted = []
-    ROW_MAP = {4:"GDB", 5:"GDF", 6:"FDB", 7:"FDE", 8:"FPT", 9:"FFD", 10:"HDP", 11:"HDT", 12:"HDF", 13:"PPV"}
-
+    # 파일별 파싱 결과는 내용 해시로 캐시 -> 리런마다 다시 읽지 않음
+    parsed = st.session_state.parsed_uploads
+    upload_keys, to_parse = [], {}
     for f in files:
-        date_tag = re.search(r'\d{8}', f.name).group() if re.search(r'\d{8}', f.name) else f.name
-        df_raw = pd.read_excel(f, header=None)
-        dates_raw = df_raw.iloc[2, 2:].values
-        
-        for r_idx, rid in ROW_MAP.items():
-            if r_idx < len(df_raw):
-                tot = pd.to_numeric(df_raw.iloc[r_idx, 1], errors='coerce')
-                for d_val, av in zip(dates_raw, df_raw.iloc[r_idx, 2:].values):
-                    d_obj = robust_date_parser(d_val)
-                    if d_obj is None: continue
-                    new_extracted.append({"Date": d_obj, "RoomID": rid, "Available": pd.to_numeric(av, errors='coerce'), "Total": tot, "Tag": date_tag})
-
-    if new_extracted:
-        new_df = pd.DataFrame(new_extracted)
-        
-        # [핵심] 사이드바에서 로드된 prev_df가 없으면 -> DB에서 가져옴
-        if st.session_state.prev_df.empty:
-            latest_db, save_dt = get_latest_snapshot()
-            if not latest_db.empty:
-                # [스마트 병합] 기존 DB + 새 파일 덮어쓰기
-                combined = pd.concat([new_df, latest_db]).drop_duplicates(subset=['Date', 'RoomID'], keep='first')
-                st.session_state.today_df = combined.sort_values(by=['Date', 'RoomID'])
-                st.session_state.prev_df = latest_db
-                st.session_state.compare_label = f"자동 DB 병합/비교: {save_dt} 기준"
+        data = f.getvalue()
+        key = upload_key(f.name, data)
+        if key not in parsed: to_parse[key] = (f.name, data)
+        upload_keys.append(key)
+    if to_parse:
+        with trace.span("parse", files=len(to_parse), bytes=sum(len(d) for _, d in to_parse.values())) as span:
+            parsed.update(zip(to_parse, parse_reports(list(to_parse.values()))))
+            span["rows"] = sum(len(parsed[k]) for k in to_parse)
+    for key in [k for k in parsed if k not in upload_keys]: parsed.pop(key)
+
+    pending = [k for k in upload_keys if k not in st.session_state.applied_uploads]
+    new_frames = [parsed[k] for k in pending if not parsed[k].empty]
+    all_frames = [parsed[k] for k in upload_keys if not parsed[k].empty]
+
+    if new_frames:
+        with trace.span("merge") as merge_span:
+            # [핵심] 사이드바에서 로드된 prev_df가 없으면 -> DB에서 가져옴
+            if st.session_state.prev_df.empty:
+                all_df = pd.concat(all_frames, ignore_index=True)
+                with trace.span("latest_snapshot") as span:
+                    latest_db, save_dt, latest_id = get_latest_snapshot()
+                    span["rows"] = len(latest_db)
+                if not latest_db.empty:
+                    # [스마트 병합] 기존 DB + 새 파일 덮어쓰기
+                    st.session_state.today_df = upsert_rows(latest_db, all_df)
+                    st.session_state.prev_df = latest_db
+                    st.session_state.prev_ref = latest_id
+                    st.session_state.compare_label = f"자동 DB 병합/비교: {save_dt} 기준"
+                else:
+                    st.session_state.today_df = upsert_rows(pd.DataFrame(), all_df)
+                    st.session_state.prev_df = pd.DataFrame()
+                    st.session_state.prev_ref = None
+                    st.session_state.compare_label = "비교 대상 없음 (신규)"
             else:
-                st.session_state.today_df = new_df
-                st.session_state.prev_df = pd.DataFrame()
-                st.session_state.compare_label = "비교 대상 없음 (신규)"
-        else:
-            # 사이드바에서 불러온게 있으면 그걸 유지
-            combined = pd.concat([new_df, st.session_state.today_df]).drop_duplicates(subset=['Date', 'RoomID'], keep='first')
-            st.session_state.today_df = combined.sort_values(by=['Date', 'RoomID'])
+                # 사이드바에서 불러온게 있으면 그걸 유지하고 새 파일만 upsert
+                new_df = pd.concat(new_frames, ignore_index=True)
+                st.session_state.today_df = upsert_rows(st.session_state.today_df, new_df)
+            merge_span["rows"] = len(st.session_state.today_df)
+    st.session_state.applied_uploads.update(upload_keys)
 
-# --- 8. 메인 출력 ---
+# --- 5. 메인 출력 ---
 if not st.session_state.today_df.empty:
     curr, prev = st.session_state.today_df, st.session_state.prev_df
+    data_key = frame_fingerprint(curr) + frame_fingerprint(prev)
+    grid_holder = []
+
+    def ensure_grid():
+        # 그리드는 캐시 미스가 있을 때만 한 번 생성
+        if not grid_holder:
+            with trace.span("grid") as span:
+                grid_holder.append(build_rate_grid(curr, prev))
+                span["cells"] = len(grid_holder[0]["rooms"]) * len(grid_holder[0]["dates"])
+        return grid_holder[0]
+
+    # 날짜 창: 보이는 구간만 그려서 HTML 크기/생성 시간이 전체 기간이 아닌 창 크기에 비례
+    all_dates = sorted(curr['Date'].unique())
+    c1, c2 = st.columns([1, 3])
+    window_days = c1.selectbox("표시 기간 (일)", WINDOW_CHOICES, index=WINDOW_CHOICES.index(DEFAULT_WINDOW_DAYS))
+    if window_days != "전체" and len(all_dates) > window_days:
+        pages = math.ceil(len(all_dates) / window_days)
+        page = c2.slider("페이지", 1, pages, 1)
+        window = ((page - 1) * window_days, min(page * window_days, len(all_dates)))
+    else:
+        window = (0, len(all_dates))
+    st.caption(f"{all_dates[window[0]]} ~ {all_dates[window[1] - 1]} ({window[1] - window[0]}일 / 전체 {len(all_dates)}일)")
+
+    def table_html(title, mode, ch_name=None):
+        # 판매가 표는 해당 채널 상품만 키에 포함 -> 한 채널 수정 시 그 표만 다시 그림
+        items = st.session_state.promotions.get(ch_name, {}).get("items", []) if mode == "판매가" else None
+        key = render_cache_key(data_key, mode, title, ch_name, items, window)
+        def _render():
+            return render_master_table(curr, prev, ch_name=ch_name, title=title, mode=mode, grid=ensure_grid(), window=window, items=items)
+        rows = len(items) if mode == "판매가" else curr['RoomID'].nunique()
+        with trace.span(f"render:{ch_name or mode}", cached=key in st.session_state.render_cache, cells=rows * (window[1] - window[0])) as span:
+            html = get_cached_html(st.session_state.render_cache, key, _render)
+            span["html_bytes"] = len(html.encode())
+        return html
     
     if st.session_state.compare_label:
         st.info(f"ℹ️ {st.session_state.compare_label}")
         
-    st.markdown(render_master_table(curr, prev, title="📊 1. 시장 분석", mode="기준"), unsafe_allow_html=True)
-    st.markdown(render_master_table(curr, prev, title="📈 2. 예약 변화량", mode="변화"), unsafe_allow_html=True)
-    st.markdown(render_master_table(curr, prev, title="🔔 3. 판도 변화", mode="판도변화"), unsafe_allow_html=True)
+    st.markdown(f"<style>{RATE_TABLE_CSS}</style>", unsafe_allow_html=True)
+    st.markdown(table_html("📊 1. 시장 분석", "기준"), unsafe_allow_html=True)
+    st.markdown(table_html("📈 2. 예약 변화량", "변화"), unsafe_allow_html=True)
+    st.markdown(table_html("🔔 3. 판도 변화", "판도변화"), unsafe_allow_html=True)
+    if not prev.empty:
+        # change-set 도 데이터가 같으면 리런 간 재사용
+        cached_changes = st.session_state.get("change_set")
+        if cached_changes and cached_changes[0] == data_key:
+            changes = cached_changes[1]
+        else:
+            with trace.span("change_set") as span:
+                changes = grid_holder[0]["changes"] if grid_holder else compute_change_set(curr, prev)
+                span["rows"] = len(changes)
+            st.session_state.change_set = (data_key, changes)
+        bar_moves = changes[changes['BarChanged']]
+        with st.expander(f"🔎 변경 내역: BAR 변경 {len(bar_moves)}건 / 잔여 변동 {int((changes['Pickup'] != 0).sum())}건"):
+            st.dataframe(bar_moves if st.checkbox("BAR 변경만 보기", value=True) else changes, use_container_width=True, hide_index=True)
     for ch in st.session_state.channel_list:
-        st.markdown(render_master_table(curr, prev, ch_name=ch, title=f"✅ {ch} 판매가 산출", mode="판매가"), unsafe_allow_html=True)
+        st.markdown(table_html(f"✅ {ch} 판매가 산출", "판매가", ch_name=ch), unsafe_allow_html=True)
+
+    if st.session_state.channel_list:
+        # 내보내기 파일은 요청 시에만 생성하고, 데이터/상품이 바뀌면 다시 만들도록 키를 붙여 둠
+        export_key = render_cache_key(data_key, "export", "", None, [st.session_state.channel_list, st.session_state.promotions])
+        if st.button("📦 전체 채널 판매가 내보내기"):
+            with trace.span("export") as span:
+                matrix = sell_price_matrix(ensure_grid(), st.session_state.promotions, st.session_state.channel_list)
+                span["cells"] = matrix.size
+                if matrix.empty: st.info("등록된 상품이 없어 내보낼 판매가가 없습니다. 채널 관리에서 상품을 추가하세요.")
+                else:
+                    xlsx = export_sell_prices(matrix, "xlsx", channel_list=st.session_state.channel_list)
+                    st.session_state.export_bundle = (export_key, xlsx, export_sell_prices(matrix, "csv"))
+        bundle = st.session_state.get("export_bundle")
+        if bundle and bundle[0] == export_key:
+            c1, c2 = st.columns(2)
+            c1.download_button("⬇️ 채널별 시트 (xlsx)", bundle[1], file_name=f"channel_rates_{date.today():%Y%m%d}.xlsx")
+            c2.download_button("⬇️ 전체 채널 (csv)", bundle[2], file_name=f"channel_rates_{date.today():%Y%m%d}.csv", mime="text/csv")
+
+# --- 6. 예약 페이스 분석 ---
+with st.expander("📉 예약 페이스 / 픽업 분석 (다중 스냅샷)"):
+    c1, c2 = st.columns(2)
+    n_snaps = c1.number_input("최근 스냅샷 수", min_value=2, max_value=365, value=PACE_SNAPSHOTS)
+    pickup_days = c2.number_input("픽업 기간 (일)", min_value=1, max_value=90, value=PACE_PICKUP_DAYS)
+    if st.checkbox("분석 실행", key="pace_on"):
+        with trace.span("pace_cube") as span:
+            cube = load_pace_cube(int(n_snaps))
+            span["cells"] = int(cube["mask"].size)
+        if len(cube["snapshot_ids"]) < 2:
+            st.warning("비교할 스냅샷이 2개 이상 필요합니다.")
+        else:
+            st.caption(f"스냅샷 {len(cube['snapshot_ids'])}개: {cube['work_dates'][0]} ~ {cube['work_dates'][-1]}")
+            pickup, base_date = n_day_pickup(cube, int(pickup_days))
+            span_days = (pd.Timestamp(cube["work_dates"][-1]) - pd.Timestamp(base_date)).days
+            st.markdown(f"**{span_days}일 픽업 (객실 x 투숙일): {base_date} → {cube['work_dates'][-1]}**")
+            if span_days < int(pickup_days): st.warning(f"{int(pickup_days)}일 이전 스냅샷이 없어 가장 오래된 {base_date} 기준 {span_days}일 픽업으로 표시합니다.")
+            st.dataframe(pickup.rename(columns=lambda d: d.strftime('%m-%d')), use_container_width=True)
+            curves = pickup_curves(cube)
+            stay_dates = st.multiselect("픽업 곡선 투숙일", cube["dates"], default=cube["dates"][:5], format_func=lambda d: d.strftime('%m-%d'))
+            if stay_dates: st.line_chart(curves[stay_dates].rename(columns=lambda d: d.strftime('%m-%d')))
+            _, changes = bar_history(cube)
+            st.markdown("**BAR 변경 횟수 (동적 객실)**")
+            st.dataframe(changes.loc[DYNAMIC_ROOMS].rename(columns=lambda d: d.strftime('%m-%d')), use_container_width=True)
+
+# --- 7. 진단 (리런별 단계 시간 / 저장소 호출 / 프로파일) ---
+profiler = st.session_state.pop("profiler", None)
+if profiler:
+    profiler.disable()
+    st.session_state.profile_report = (trace.at, profile_report(profiler))
+store_calls = store_delta(store_before, meter_stats(get_store()))
+diag = {"at": trace.at, "total_ms": trace.elapsed_ms(), "spans": trace.spans, "store": store_calls}
+
+if st.sidebar.checkbox("🩺 진단 패널", key="diag_on"):
+    with st.expander(f"🩺 진단: 이번 리런 {diag['total_ms']:.0f} ms", expanded=True):
+        if trace.spans:
+            spans = pd.DataFrame(trace.spans)
+            spans['phase'] = ["  " * d + p for d, p in zip(spans.pop('depth'), spans['phase'])]
+            st.dataframe(spans, use_container_width=True, hide_index=True)
+        else: st.caption("기록된 단계 없음")
+        st.markdown("**저장소 호출**")
+        if store_calls: st.dataframe(pd.DataFrame(store_calls), use_container_width=True, hide_index=True)
+        else: st.caption("이번 리런에는 저장소 호출 없음 (캐시 사용)")
+        st.caption(f"리런 기록: {DIAG_LOG_PATH}")
+        if st.button("🧪 다음 리런 cProfile 캡처"):
+            st.session_state.profile_next = True
+            st.rerun()
+        report = st.session_state.get("profile_report")
+        if report:
+            st.markdown(f"**cProfile ({report[0]} 리런, 누적 시간 순)**")
+            st.code(report[1], language=None)
+            st.download_button("⬇️ 프로파일 (txt)", report[1], file_name=f"profile_{report[0].replace(':', '')}.txt")
+
+append_diag_log(DIAG_LOG_PATH, diag)
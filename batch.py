@@ -0,0 +1,137 @@
+# 엠버퓨어힐 야간 배치: 리포트 폴더를 날짜 태그(YYYYMMDD) 순으로 병합해 스냅샷과 채널 판매가 파일을 저장
+# 예) python batch.py reports/ --store sqlite --db purehill_rate.sqlite3 --export-dir exports/
+import argparse
+import os
+import sys
+from datetime import datetime
+import pandas as pd
+from rate_core import (
+    PARSE_WORKERS, worker_pool, report_date_tag, parse_reports, upsert_rows, encode_snapshot, decode_snapshot,
+    build_rate_grid, sell_price_matrix, export_sell_prices,
+)
+from rate_store import FirestoreStore, SQLiteStore, CachedStore, new_snapshot_id
+
+REPORT_EXTS = (".xlsx", ".xlsm", ".xls")
+FLUSH_TIMEOUT = 120.0   # 종료 전 write-behind 대기 한도 (초)
+
+def collect_reports(report_dir):
+    """파일명에 유효한 YYYYMMDD 태그가 있는 리포트를 태그별로 묶어 오래된 순 [(태그, [경로])] 로 반환"""
+    groups = {}
+    for name in sorted(os.listdir(report_dir)):
+        tag = report_date_tag(name)
+        if not name.lower().endswith(REPORT_EXTS) or tag == name: continue
+        try: datetime.strptime(tag, "%Y%m%d")
+        except ValueError: continue
+        groups.setdefault(tag, []).append(os.path.join(report_dir, name))
+    return sorted(groups.items())
+
+def open_store(kind, db_path, cred_path=None):
+    if kind == "sqlite": return SQLiteStore(db_path)
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+    if not firebase_admin._apps:
+        firebase_admin.initialize_app(credentials.Certificate(cred_path) if cred_path else None)
+    primary = FirestoreStore(firestore.client())
+    if kind == "firestore": return primary
+    return CachedStore(primary, SQLiteStore(db_path))
+
+def _export_day(job):
+    """(태그, today, prev, 채널목록, promotions, 출력폴더, 형식) -> (태그, 저장된 파일 경로 | 상품이 없으면 None)"""
+    tag, today_df, prev_df, channel_list, promotions, export_dir, fmt = job
+    matrix = sell_price_matrix(build_rate_grid(today_df, prev_df), promotions, channel_list)
+    if matrix.empty: return tag, None
+    path = os.path.join(export_dir, f"channel_rates_{tag}.{fmt}")
+    with open(path, "wb") as f: f.write(export_sell_prices(matrix, fmt=fmt, channel_list=channel_list))
+    return tag, path
+
+def _work_date(tag):
+    return datetime.strptime(tag, "%Y%m%d").strftime("%Y-%m-%d")
+
+def _load_today(store, doc_id):
+    doc = store.load_snapshot(doc_id)
+    return decode_snapshot(doc, with_prev=False)[0] if doc is not None else pd.DataFrame()
+
+def run_batch(store, report_dir, export_dir=None, fmt="xlsx", workers=PARSE_WORKERS, fresh=False, force=False, log=print):
+    """태그 순서대로 하루씩 upsert -> 스냅샷 저장 (prev 는 직전 스냅샷 참조), 저장된 스냅샷 id 목록 반환 (리포트가 없으면 None)
+    이미 스냅샷이 있는 날짜는 건너뛰고 그 스냅샷을 다음 날의 기준으로 씀 (force 면 같은 문서를 다시 만들어 덮어씀)"""
+    groups = collect_reports(report_dir)
+    if not groups:
+        log(f"처리할 리포트 없음: {report_dir}")
+        return None
+    existing = {tag: store.find_snapshot_id(_work_date(tag)) for tag, _ in groups}
+    todo = {tag for tag, _ in groups if force or not existing[tag]}
+    uploads = []
+    for tag, paths in groups:
+        if tag not in todo: continue
+        for path in paths:
+            with open(path, "rb") as f: uploads.append((os.path.basename(path), f.read()))
+    # 처리할 날짜의 파일을 한 번에 풀에 넣어 병렬 파싱 (결과는 입력 순서 유지)
+    parsed = iter(parse_reports(uploads, workers=workers))
+
+    # 기준은 저장소 전체의 최신이 아니라 첫 태그보다 이전 날짜의 최신 스냅샷 (과거 날짜를 다시 돌려도 미래 재고가 섞이지 않게)
+    current, prev_id = pd.DataFrame(), None
+    ref = None if fresh else store.snapshot_ref_before(_work_date(groups[0][0]))
+    if ref:
+        current, prev_id = _load_today(store, ref[0]), ref[0]
+        log(f"기준 스냅샷: {ref[2] or '알수없음'} ({prev_id})")
+
+    configs = store.load_channel_configs()
+    channel_list, promotions = configs.get("channel_list", []), configs.get("promotions", {})
+    saved, jobs = [], []
+    for tag, paths in groups:
+        if tag not in todo:
+            log(f"{tag}: 이미 저장된 스냅샷 {existing[tag]} 있음, 건너뜀 (다시 만들려면 --force)")
+            current, prev_id = None, existing[tag]   # 다음 날짜를 처리할 때만 읽어옴
+            continue
+        frames = [df for df in (next(parsed) for _ in paths) if not df.empty]
+        if not frames:
+            log(f"{tag}: 유효한 행 없음, 건너뜀")
+            continue
+        if current is None: current = _load_today(store, prev_id)
+        today = upsert_rows(current, pd.concat(frames, ignore_index=True))
+        doc_id = existing[tag] or new_snapshot_id()
+        store.save_snapshot(doc_id, {
+            "work_date": _work_date(tag),
+            "save_time": datetime.now().isoformat(),
+            **encode_snapshot(today, current, prev_ref=prev_id),
+            "saved_promotions": promotions,
+            "saved_channel_list": channel_list
+        })
+        log(f"{tag}: 파일 {len(paths)}개, {len(today)}행 -> 스냅샷 {doc_id}" + (" (덮어씀)" if existing[tag] else ""))
+        if export_dir and channel_list:
+            jobs.append((tag, today, current, channel_list, promotions, export_dir, fmt))
+        saved.append(doc_id)
+        current, prev_id = today, doc_id
+
+    if jobs:
+        os.makedirs(export_dir, exist_ok=True)
+        n = min(workers, len(jobs), os.cpu_count() or 1)
+        if n <= 1: paths = [_export_day(job) for job in jobs]
+        else: paths = list(worker_pool(n).map(_export_day, jobs))   # 파싱에 쓴 풀이 있으면 그대로 재사용
+        for tag, path in paths:
+            log(f"판매가 내보내기: {path}" if path else f"{tag}: 등록된 상품이 없어 판매가 내보내기 건너뜀")
+    if hasattr(store, "flush") and not store.flush(timeout=FLUSH_TIMEOUT):
+        log(f"Firestore 반영 대기 {store.pending()}건이 {FLUSH_TIMEOUT:.0f}초 안에 끝나지 않음 (로컬 SQLite 에는 저장됨)")
+    for err in store.drain_errors(): log(f"저장 실패: {err}")
+    return saved
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="리포트 폴더 야간 배치 처리 (스냅샷 저장 + 채널 판매가 내보내기)")
+    parser.add_argument("report_dir", help="YYYYMMDD 태그가 붙은 리포트 파일 폴더")
+    parser.add_argument("--store", choices=["sqlite", "firestore", "cached"], default=os.environ.get("RATE_STORE", "cached"))
+    parser.add_argument("--db", default=os.environ.get("RATE_STORE_PATH", "purehill_rate.sqlite3"), help="SQLite 경로 (sqlite / cached)")
+    parser.add_argument("--firebase-cred", help="서비스 계정 JSON 경로 (없으면 기본 자격 증명)")
+    parser.add_argument("--export-dir", help="채널 판매가 파일 출력 폴더 (생략 시 내보내지 않음)")
+    parser.add_argument("--format", choices=["xlsx", "csv"], default="xlsx")
+    parser.add_argument("--workers", type=int, default=PARSE_WORKERS)
+    parser.add_argument("--fresh", action="store_true", help="저장소의 이전 스냅샷과 병합하지 않고 새로 시작")
+    parser.add_argument("--force", action="store_true", help="이미 스냅샷이 있는 날짜도 다시 만들어 덮어씀")
+    args = parser.parse_args(argv)
+    if not os.path.isdir(args.report_dir): parser.error(f"폴더가 없음: {args.report_dir}")
+
+    store = open_store(args.store, args.db, args.firebase_cred)
+    saved = run_batch(store, args.report_dir, export_dir=args.export_dir, fmt=args.format, workers=args.workers, fresh=args.fresh, force=args.force)
+    return 0 if saved is not None else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
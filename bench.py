@@ -0,0 +1,193 @@
+# 엠버퓨어힐 요금 엔진 벤치마크: 합성 PMS 리포트/채널 설정으로 단계별 소요 시간을 JSON 으로 기록
+# 예) python bench.py --output bench.json
+#     python bench.py --horizons 30,365 --channels 1,10 --baseline bench.json   (회귀 비교)
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import date, datetime, timedelta
+import numpy as np
+import pandas as pd
+from rate_core import (
+    ALL_ROOMS, ROW_MAP, REPORT_HEADER_ROW, REPORT_DATA_COL, PARSE_WORKERS, PARSE_POOL_MIN_BYTES,
+    get_final_values, compute_final_values, build_rate_grid, sell_price_matrix, render_master_table,
+    parse_reports, upsert_rows, encode_snapshot, decode_snapshot,
+)
+from rate_store import SQLiteStore, new_snapshot_id, _doc_to_json
+
+HORIZONS = [30, 180, 365, 730]
+CHANNEL_COUNTS = [1, 10, 50]
+TABLE_MODES = ["기준", "변화", "판도변화"]
+BENCH_START = date(2026, 3, 1)
+MULTI_PARSE_FILES = 10   # parse:multi 단계에서 한 번에 넘기는 리포트 수 (배치/여러 파일 업로드)
+
+# --- 1. 합성 데이터 ---
+def make_report(start, days, seed):
+    """파서가 읽는 레이아웃 그대로의 xlsx: REPORT_HEADER_ROW 행에 날짜, ROW_MAP 행에 객실, 1열에 총 객실수"""
+    import openpyxl
+    rng = np.random.default_rng(seed)
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.cell(1, 1, f"재고 현황 {start:%Y%m%d}")
+    for j in range(days):
+        ws.cell(REPORT_HEADER_ROW + 1, REPORT_DATA_COL + 1 + j, (start + timedelta(j)).strftime("%m-%d"))
+    for r_idx, rid in ROW_MAP.items():
+        total = int(rng.integers(10, 41))
+        ws.cell(r_idx + 1, 1, rid)
+        ws.cell(r_idx + 1, 2, total)
+        avail = rng.integers(0, total + 1, size=days)
+        blank = rng.random(days) < 0.03
+        for j in range(days):
+            if not blank[j]: ws.cell(r_idx + 1, REPORT_DATA_COL + 1 + j, int(avail[j]))
+    buf = io.BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+def make_promotions(n_channels, seed):
+    """채널마다 2~12개 상품 (객실타입/할인/추가금 무작위, 일부는 빈 값)"""
+    rng = np.random.default_rng(seed)
+    channel_list = [f"CH{i:02d}" for i in range(n_channels)]
+    promotions = {}
+    for ch in channel_list:
+        items = []
+        for k in range(int(rng.integers(2, 13))):
+            items.append({
+                "객실타입": str(rng.choice(ALL_ROOMS)),
+                "상품명": f"{ch}-상품{k}",
+                "할인(%)": None if rng.random() < 0.2 else int(rng.integers(0, 31)),
+                "추가금": None if rng.random() < 0.5 else int(rng.integers(0, 6)) * 10000,
+            })
+        promotions[ch] = {"items": items}
+    return channel_list, promotions
+
+# --- 2. 측정 ---
+def timed(fn, repeat):
+    """fn 을 repeat 번 실행해 (마지막 결과, [ms...]) 반환"""
+    times, result = [], None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        times.append((time.perf_counter() - t0) * 1000)
+    return result, times
+
+def record(results, stage, times, horizon, channels=None, **extra):
+    results.append({
+        "stage": stage, "horizon": horizon, "channels": channels,
+        "median_ms": round(statistics.median(times), 3), "min_ms": round(min(times), 3), "repeat": len(times),
+        **extra,
+    })
+
+def bench_horizon(horizon, channel_counts, repeat, results, log):
+    prev_bytes = make_report(BENCH_START, horizon, seed=horizon)
+    today_bytes = make_report(BENCH_START + timedelta(1), horizon, seed=horizon + 1)
+    uploads = [(f"report_{BENCH_START + timedelta(1):%Y%m%d}.xlsx", today_bytes)]
+    prev_df = parse_reports([(f"report_{BENCH_START:%Y%m%d}.xlsx", prev_bytes)])[0]
+
+    parsed, times = timed(lambda: parse_reports(uploads), repeat)
+    new_df = parsed[0]
+    record(results, "parse", times, horizon, rows=len(new_df), bytes=len(today_bytes))
+
+    multi = [(f"report_{BENCH_START + timedelta(i):%Y%m%d}.xlsx", make_report(BENCH_START + timedelta(i), horizon, seed=horizon + i))
+             for i in range(MULTI_PARSE_FILES)]
+    multi_bytes = sum(len(data) for _, data in multi)
+    pooled = min(PARSE_WORKERS, len(multi), os.cpu_count() or 1) > 1 and multi_bytes >= PARSE_POOL_MIN_BYTES
+    parse_reports(multi)   # 풀을 쓰는 경우 워커 기동은 한 번뿐이므로 측정에서 제외
+    parsed, times = timed(lambda: parse_reports(multi), repeat)
+    record(results, "parse:multi", times, horizon, files=len(multi), bytes=multi_bytes, rows=sum(len(df) for df in parsed), pool=pooled)
+
+    # 스마트 병합: DB 최신 스냅샷(전날) + 오늘 업로드
+    today_df, times = timed(lambda: upsert_rows(prev_df, new_df), repeat)
+    record(results, "merge", times, horizon, rows=len(today_df))
+
+    _, times = timed(lambda: [get_final_values(r.RoomID, r.Date, r.Available, r.Total) for r in today_df.itertuples()], repeat)
+    record(results, "pricing_scalar", times, horizon, rows=len(today_df))
+    _, times = timed(lambda: compute_final_values(today_df), repeat)
+    record(results, "pricing", times, horizon, rows=len(today_df))
+
+    grid, times = timed(lambda: build_rate_grid(today_df, prev_df), repeat)
+    cells = len(grid["rooms"]) * len(grid["dates"])
+    record(results, "grid", times, horizon, cells=cells)
+    for mode in TABLE_MODES:
+        html, times = timed(lambda: render_master_table(today_df, prev_df, title=mode, mode=mode, grid=grid), repeat)
+        record(results, f"render:{mode}", times, horizon, cells=cells, html_bytes=len(html.encode()))
+
+    store = SQLiteStore(":memory:")
+    doc, times = timed(lambda: encode_snapshot(today_df, prev_df), repeat)
+    record(results, "snapshot:encode", times, horizon, rows=len(today_df) + len(prev_df))
+    doc = {"work_date": f"{BENCH_START + timedelta(1)}", "save_time": datetime.now().isoformat(), **doc}
+    doc_ids = iter([new_snapshot_id() for _ in range(repeat)])
+    _, times = timed(lambda: store.save_snapshot(next(doc_ids), doc), repeat)
+    doc_id = store.latest_snapshot_ref()[0]
+    record(results, "snapshot:save", times, horizon, doc_bytes=len(_doc_to_json(doc).encode()))
+    loaded, times = timed(lambda: store.load_snapshot(doc_id), repeat)
+    record(results, "snapshot:load", times, horizon)
+    _, times = timed(lambda: decode_snapshot(loaded), repeat)
+    record(results, "snapshot:decode", times, horizon, rows=len(today_df) + len(prev_df))
+
+    for n in channel_counts:
+        channel_list, promotions = make_promotions(n, seed=n)
+        n_items = sum(len(promotions[ch]["items"]) for ch in channel_list)
+        _, times = timed(lambda: store.save_channel_configs({"channel_list": channel_list, "promotions": promotions}), repeat)
+        record(results, "configs:save", times, horizon, n, items=n_items)
+        _, times = timed(store.load_channel_configs, repeat)
+        record(results, "configs:load", times, horizon, n, items=n_items)
+        _, times = timed(lambda: sell_price_matrix(grid, promotions, channel_list), repeat)
+        record(results, "sell_matrix", times, horizon, n, cells=n_items * len(grid["dates"]))
+        tables, times = timed(lambda: [render_master_table(today_df, prev_df, ch_name=ch, title=ch, mode="판매가", grid=grid, items=promotions[ch]["items"]) for ch in channel_list], repeat)
+        record(results, "render:판매가", times, horizon, n, items=n_items, html_bytes=sum(len(t.encode()) for t in tables))
+    log(f"{horizon}일 완료")
+
+# --- 3. 회귀 비교 ---
+def result_key(r):
+    return (r["stage"], r["horizon"], r["channels"])
+
+def compare(results, baseline, threshold):
+    """baseline 대비 median 이 threshold 배 넘게 느려진 단계 목록"""
+    base = {result_key(r): r for r in baseline["results"]}
+    slower = []
+    for r in results:
+        old = base.get(result_key(r))
+        if old and old["median_ms"] > 0 and r["median_ms"] / old["median_ms"] > threshold:
+            slower.append({"stage": r["stage"], "horizon": r["horizon"], "channels": r["channels"],
+                           "baseline_ms": old["median_ms"], "median_ms": r["median_ms"],
+                           "ratio": round(r["median_ms"] / old["median_ms"], 2)})
+    return slower
+
+def int_list(text):
+    return [int(x) for x in text.split(",") if x.strip()]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="단계별 벤치마크 (parse / merge / pricing / render / snapshot)")
+    parser.add_argument("--horizons", type=int_list, default=HORIZONS, help="리포트 일수 목록 (쉼표 구분)")
+    parser.add_argument("--channels", type=int_list, default=CHANNEL_COUNTS, help="채널 수 목록 (쉼표 구분)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="결과 JSON 경로 (생략 시 stdout)")
+    parser.add_argument("--baseline", help="이전 결과 JSON: 느려진 단계가 있으면 종료 코드 1")
+    parser.add_argument("--threshold", type=float, default=1.25, help="회귀로 볼 median 배율")
+    args = parser.parse_args(argv)
+
+    log = lambda msg: print(msg, file=sys.stderr)
+    results = []
+    for horizon in args.horizons:
+        bench_horizon(horizon, args.channels, max(args.repeat, 1), results, log)
+    report = {
+        "generated": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(), "cpus": os.cpu_count(), "pandas": pd.__version__, "numpy": np.__version__,
+        "repeat": args.repeat, "results": results,
+    }
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            report["regressions"] = compare(results, json.load(f), args.threshold)
+    text = json.dumps(report, ensure_ascii=False, indent=1)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f: f.write(text)
+    else:
+        print(text)
+    return 1 if report.get("regressions") else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,843 @@
+# 엠버퓨어힐 요금 엔진 코어: 가격/파싱/병합/스냅샷/렌더링 로직
+# Streamlit, Firebase 를 import 하지 않으므로 app.py, batch.py, 벤치마크에서 부작용 없이 가져다 쓸 수 있음
+import pandas as pd
+import numpy as np
+from datetime import datetime, date
+import math
+import re
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+# --- 1. 전역 설정 데이터 ---
+BAR_GRADIENT_COLORS = {
+    "BAR1": "#D32F2F", "BAR2": "#EF5350", "BAR3": "#FF8A65", "BAR4": "#FFB199",
+    "BAR5": "#81C784", "BAR6": "#A5D6A7", "BAR7": "#C8E6C9", "BAR8": "#E8F5E9",
+}
+BAR_LIGHT_COLORS = {
+    "BAR1": "#FFEBEE", "BAR2": "#FFEBEE", "BAR3": "#FFF3E0", "BAR4": "#FFF3E0",
+    "BAR5": "#E8F5E9", "BAR6": "#E8F5E9", "BAR7": "#F1F8E9", "BAR8": "#F1F8E9",
+}
+WEEKDAYS_KR = ['월', '화', '수', '목', '금', '토', '일']
+DYNAMIC_ROOMS = ["FDB", "FDE", "HDP", "HDT", "HDF"]
+FIXED_ROOMS = ["GDB", "GDF", "FFD", "FPT", "PPV"]
+ALL_ROOMS = DYNAMIC_ROOMS + FIXED_ROOMS
+# 리포트 엑셀의 행 번호 -> 객실 (2행: 날짜, 1열: 총 객실수)
+ROW_MAP = {4:"GDB", 5:"GDF", 6:"FDB", 7:"FDE", 8:"FPT", 9:"FFD", 10:"HDP", 11:"HDT", 12:"HDF", 13:"PPV"}
+
+PRICE_TABLE = {
+    "FDB": {"BAR8": 315000, "BAR7": 353000, "BAR6": 396000, "BAR5": 445000, "BAR4": 502000, "BAR3": 567000, "BAR2": 642000, "BAR1": 728000},
+    "FDE": {"BAR8": 352000, "BAR7": 390000, "BAR6": 433000, "BAR5": 482000, "BAR4": 539000, "BAR3": 604000, "BAR2": 679000, "BAR1": 765000},
+    "HDP": {"BAR8": 250000, "BAR7": 288000, "BAR6": 331000, "BAR5": 380000, "BAR4": 437000, "BAR3": 502000, "BAR2": 577000, "BAR1": 663000},
+    "HDT": {"BAR8": 250000, "BAR7": 288000, "BAR6": 331000, "BAR5": 380000, "BAR4": 437000, "BAR3": 502000, "BAR2": 577000, "BAR1": 663000},
+    "HDF": {"BAR8": 420000, "BAR7": 458000, "BAR6": 501000, "BAR5": 550000, "BAR4": 607000, "BAR3": 672000, "BAR2": 747000, "BAR1": 833000},
+}
+FIXED_PRICE_TABLE = {
+    "GDB": {"UND1": 180000, "UND2": 180000, "MID1": 225000, "MID2": 225000, "UPP1": 285000, "UPP2": 315000},
+    "GDF": {"UND1": 375000, "UND2": 375000, "MID1": 410000, "MID2": 410000, "UPP1": 488000, "UPP2": 488000},
+    "FFD": {"UND1": 353000, "UND2": 353000, "MID1": 445000, "MID2": 445000, "UPP1": 567000, "UPP2": 567000},
+    "FPT": {"UND1": 500000, "UND2": 550000, "MID1": 600000, "MID2": 650000, "UPP1": 700000, "UPP2": 750000},
+    "PPV": {"UND1": 1100000, "UND2": 1100000, "MID1": 1250000, "MID2": 1250000, "UPP1": 1400000, "UPP2": 1400000},
+}
+
+# 시즌 캘린더: (시작 MM-DD, 끝 MM-DD, 시즌, 주말취급) — 위에서부터 처음 맞는 구간 적용
+# 주말취급 None 은 실제 요일(금/토) 기준, 어느 구간에도 없으면 MID + 실제 요일
+# 연도 키에는 음력 명절처럼 해마다 바뀌는 구간만 두고, 그 뒤에 "default" 의 고정 구간을 이어서 적용
+# 연도 항목이 없는 해는 명절 없이 고정 구간만 쓰므로 경고를 남김 (다음 해 명절은 여기에 추가)
+SEASON_CALENDAR = {
+    2025: [
+        ("01-27", "01-30", "UPP", True),   # 설 연휴 (임시공휴일 01-27 포함)
+        ("10-04", "10-08", "UPP", True),   # 추석 연휴 (대체공휴일 10-08 포함)
+    ],
+    2026: [
+        ("02-13", "02-18", "UPP", True),   # 설 연휴
+        ("09-23", "09-28", "UPP", True),   # 추석 연휴
+    ],
+    2027: [
+        ("02-05", "02-09", "UPP", True),   # 설 연휴 (대체공휴일 02-09 포함)
+        ("09-13", "09-16", "UPP", True),   # 추석 연휴
+    ],
+    2028: [
+        ("01-24", "01-27", "UPP", True),   # 설 연휴
+        ("10-01", "10-05", "UPP", True),   # 추석 연휴 (대체공휴일 10-05 포함)
+    ],
+    "default": [
+        ("12-21", "12-31", "UPP", False),
+        ("10-01", "10-08", "UPP", False),
+        ("05-03", "05-05", "MID", True),
+        ("05-24", "05-26", "MID", True),
+        ("06-05", "06-07", "MID", True),
+        ("07-17", "08-29", "UPP", None),   # 여름 성수기
+        ("01-04", "03-31", "UND", None),
+        ("11-01", "12-20", "UND", None),
+    ],
+}
+SEASONS = ["UND", "MID", "UPP"]
+TYPE_CODES = [f"{s}{w}" for s in SEASONS for w in (1, 2)]
+
+# --- 2. 로직 함수 ---
+_warned_years = set()
+
+class SeasonCalendar:
+    """연도별 시즌/주말 판정을 일 단위 배열로 미리 계산해 두고 인덱스로 조회"""
+
+    def __init__(self, years, calendar=SEASON_CALENDAR):
+        self.calendar = calendar
+        self.years = range(min(years), max(years) + 1)
+        self.start = np.datetime64(f"{self.years.start:04d}-01-01", 'D')
+        self.start_ordinal = date(self.years.start, 1, 1).toordinal()
+        days = np.arange(self.start, np.datetime64(f"{self.years.stop:04d}-01-01", 'D'))
+        self.season_idx = np.full(len(days), SEASONS.index("MID"), dtype=np.int8)
+        # 1970-01-01 이 목요일(weekday 3) 이므로 epoch 일수로 요일 계산, 금/토가 실제 주말
+        self.weekend = np.isin((days.astype(np.int64) + 3) % 7, [4, 5])
+
+        months = (days.astype('datetime64[M]').astype(np.int64) % 12) + 1
+        month_day = months * 100 + (days - days.astype('datetime64[M]')).astype(np.int64) + 1
+        year_of_day = days.astype('datetime64[Y]').astype(np.int64) + 1970
+        for y in self.years:
+            in_year = year_of_day == y
+            assigned = np.zeros(len(days), dtype=bool)
+            if y not in calendar and y not in _warned_years:
+                _warned_years.add(y)
+                logger.warning("시즌 캘린더에 %d년 명절 구간이 없어 고정 구간만 적용", y)
+            for start_md, end_md, season, forced_weekend in calendar.get(y, []) + calendar["default"]:
+                lo, hi = int(start_md.replace("-", "")), int(end_md.replace("-", ""))
+                hit = in_year & ~assigned & (month_day >= lo) & (month_day <= hi)
+                self.season_idx[hit] = SEASONS.index(season)
+                if forced_weekend is not None: self.weekend[hit] = forced_weekend
+                assigned |= hit
+        self.type_idx = (self.season_idx * 2 + self.weekend).astype(np.int8)
+
+    def covers(self, first, last):
+        return self.years.start <= first.year and last.year < self.years.stop
+
+    def lookup(self, date_obj):
+        pos = date_obj.toordinal() - self.start_ordinal
+        season, is_weekend = SEASONS[self.season_idx[pos]], bool(self.weekend[pos])
+        return TYPE_CODES[self.type_idx[pos]], season, is_weekend
+
+    def lookup_many(self, dates):
+        """날짜 컬럼 -> (시즌 인덱스, 주말 여부) 배열"""
+        days = pd.to_datetime(pd.Series(dates)).to_numpy().astype('datetime64[D]')
+        pos = (days - self.start).astype(np.int64)
+        return self.season_idx[pos].astype(np.int64), self.weekend[pos].astype(np.int64)
+
+_season_calendar = SeasonCalendar([date.today().year - 1, date.today().year + 2])
+
+def get_season_calendar(first, last=None):
+    """요청 범위를 포함하는 캘린더 반환 (범위 밖 연도가 오면 확장해서 다시 계산)"""
+    global _season_calendar
+    last = last or first
+    if not _season_calendar.covers(first, last):
+        years = _season_calendar.years
+        _season_calendar = SeasonCalendar([min(years.start, first.year), max(years.stop - 1, last.year)])
+    return _season_calendar
+
+def get_season_details(date_obj):
+    return get_season_calendar(date_obj).lookup(date_obj)
+
+def determine_bar(season, is_weekend, occ):
+    if season == "UPP":
+        if is_weekend:
+            if occ >= 81: return "BAR1"
+            elif occ >= 51: return "BAR2"
+            elif occ >= 31: return "BAR3"
+            else: return "BAR4"
+        else:
+            if occ >= 81: return "BAR2"
+            elif occ >= 51: return "BAR3"
+            elif occ >= 31: return "BAR4"
+            else: return "BAR5"
+    elif season == "MID":
+        if is_weekend:
+            if occ >= 81: return "BAR3"
+            elif occ >= 51: return "BAR4"
+            elif occ >= 31: return "BAR5"
+            else: return "BAR6"
+        else:
+            if occ >= 81: return "BAR4"
+            elif occ >= 51: return "BAR5"
+            elif occ >= 31: return "BAR6"
+            else: return "BAR7"
+    else: # UND
+        if is_weekend:
+            if occ >= 81: return "BAR4"
+            elif occ >= 51: return "BAR5"
+            elif occ >= 31: return "BAR6"
+            else: return "BAR7"
+        else:
+            if occ >= 81: return "BAR5"
+            elif occ >= 51: return "BAR6"
+            elif occ >= 31: return "BAR7"
+            else: return "BAR8"
+
+def get_final_values(room_id, date_obj, avail, total):
+    type_code, season, is_weekend = get_season_details(date_obj)
+    try: current_avail = float(avail) if pd.notna(avail) else 0.0
+    except: current_avail = 0.0
+    occ = ((total - current_avail) / total * 100) if total > 0 else 0
+    if room_id in DYNAMIC_ROOMS:
+        bar = determine_bar(season, is_weekend, occ)
+        price = PRICE_TABLE.get(room_id, {}).get(bar, 0)
+    else:
+        bar = type_code
+        price = FIXED_PRICE_TABLE.get(room_id, {}).get(type_code, 0)
+    return occ, bar, price
+
+# --- 2-1. 배치 가격 엔진 (get_final_values 벡터화) ---
+# determine_bar 의 점유율 경계 (오름차순): searchsorted 결과가 곧 상승 구간 수
+OCC_THRESHOLDS = np.array([31, 51, 81])
+# [시즌, 주말여부] -> 점유율 최저 구간의 BAR 번호 (구간이 하나 오를 때마다 1씩 감소)
+BAR_BASE = np.array([
+    [8, 7],  # UND: 주중, 주말
+    [7, 6],  # MID
+    [5, 4],  # UPP
+])
+# 가격 코드 축: BAR1~BAR8 다음에 타입코드(UND1, UND2, MID1, MID2, UPP1, UPP2)
+PRICE_CODES = [f"BAR{i}" for i in range(1, 9)] + TYPE_CODES
+TYPE_CODE_OFFSET = 8
+# 객실 x 가격코드 단가 행렬 (해당 없는 칸은 0)
+PRICE_MATRIX = np.array([
+    [{**PRICE_TABLE.get(r, {}), **FIXED_PRICE_TABLE.get(r, {})}.get(c, 0) for c in PRICE_CODES]
+    for r in ALL_ROOMS
+], dtype=np.int64)
+
+def occupancy_pct(avail, total):
+    """get_final_values 와 같은 점유율: 잔여 NaN 은 0, Total 이 0 이하/NaN 이면 0"""
+    avail = np.nan_to_num(np.asarray(avail, dtype=float), nan=0.0)
+    total = np.asarray(total, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(total > 0, (total - avail) / total * 100, 0.0)
+
+def price_code_index(occ, room_idx, season_idx, weekend_idx):
+    """PRICE_CODES 인덱스 (동적 객실은 BAR, 고정 객실은 타입코드). 인자는 서로 브로드캐스트 가능하면 됨"""
+    band = np.searchsorted(OCC_THRESHOLDS, occ, side='right')
+    is_dynamic = (room_idx >= 0) & (room_idx < len(DYNAMIC_ROOMS))
+    return np.where(
+        is_dynamic,
+        BAR_BASE[season_idx, weekend_idx] - band - 1,
+        TYPE_CODE_OFFSET + season_idx * 2 + weekend_idx,
+    )
+
+def compute_final_values(df):
+    """get_final_values 를 프레임 전체에 한 번에 적용해 Occ / Bar / Price 컬럼을 붙여 반환"""
+    out = df.copy()
+    if out.empty or 'Date' not in out.columns:
+        out['Occ'], out['Bar'], out['Price'] = pd.Series(dtype=float), pd.Series(dtype=object), pd.Series(dtype=np.int64)
+        return out
+
+    calendar = get_season_calendar(min(out['Date']), max(out['Date']))
+    season_idx, weekend_idx = calendar.lookup_many(out['Date'])
+
+    occ = occupancy_pct(
+        pd.to_numeric(out['Available'], errors='coerce').to_numpy(dtype=float),
+        pd.to_numeric(out['Total'], errors='coerce').to_numpy(dtype=float),
+    )
+    room_idx = pd.Index(ALL_ROOMS).get_indexer(out['RoomID'])
+    code_idx = price_code_index(occ, room_idx, season_idx, weekend_idx)
+    price = np.where(room_idx >= 0, PRICE_MATRIX[room_idx.clip(0), code_idx], 0)
+
+    out['Occ'] = occ
+    out['Bar'] = np.asarray(PRICE_CODES, dtype=object)[code_idx]
+    out['Price'] = price
+    return out
+
+# --- 2-2. 객실 x 날짜 그리드 ---
+GRID_FIELDS = {"Available": np.nan, "Total": np.nan, "Occ": np.nan, "Bar": None, "Price": 0}
+
+def _place_on_grid(df, room_index, date_index, fields):
+    shape = (len(room_index), len(date_index))
+    has = np.zeros(shape, dtype=bool)
+    arrays = {col: np.full(shape, fill, dtype=object if fill is None else np.asarray(fill).dtype) for col, fill in fields.items()}
+    if df.empty or 'Date' not in df.columns:
+        return has, arrays
+    # 기존 렌더러와 동일하게 (Date, RoomID) 중복 시 첫 행을 사용
+    df = df.drop_duplicates(subset=['Date', 'RoomID'], keep='first')
+    r = room_index.get_indexer(df['RoomID'])
+    c = date_index.get_indexer(df['Date'])
+    keep = (r >= 0) & (c >= 0)
+    r, c = r[keep], c[keep]
+    has[r, c] = True
+    for col in fields:
+        arrays[col][r, c] = df[col].to_numpy()[keep]
+    return has, arrays
+
+CHANGE_SET_COLUMNS = ["Date", "RoomID", "PrevAvailable", "Available", "Pickup", "PrevBar", "Bar", "PrevPrice", "Price", "BarChanged", "PriceChanged"]
+
+def compute_change_set(current_df, prev_df):
+    """today/prev 를 (Date, RoomID) 로 한 번 조인해 BAR/가격/잔여가 바뀐 칸만 반환 (희소 change-set)
+    Pickup = 이전 잔여 - 현재 잔여 (NaN 은 0), 양수면 그 사이 판매된 객실"""
+    cur = current_df if 'Bar' in current_df.columns else compute_final_values(current_df)
+    prev = prev_df if prev_df.empty or 'Bar' in prev_df.columns else compute_final_values(prev_df)
+    if cur.empty or prev.empty: return pd.DataFrame(columns=CHANGE_SET_COLUMNS)
+
+    keys = ['Date', 'RoomID']
+    cols = keys + ['Available', 'Bar', 'Price']
+    joined = cur[cols].drop_duplicates(subset=keys, keep='first').merge(
+        prev[cols].drop_duplicates(subset=keys, keep='first').rename(columns={'Available': 'PrevAvailable', 'Bar': 'PrevBar', 'Price': 'PrevPrice'}),
+        on=keys, how='inner',
+    )
+    curr_av = pd.to_numeric(joined['Available'], errors='coerce').fillna(0.0)
+    prev_av = pd.to_numeric(joined['PrevAvailable'], errors='coerce').fillna(0.0)
+    joined['Pickup'] = prev_av - curr_av
+    joined['BarChanged'] = joined['Bar'].astype(str).str.strip() != joined['PrevBar'].astype(str).str.strip()
+    joined['PriceChanged'] = joined['Price'] != joined['PrevPrice']
+    changed = joined[(joined['Pickup'] != 0) | joined['BarChanged'] | joined['PriceChanged']]
+    return changed[CHANGE_SET_COLUMNS].sort_values(by=keys).reset_index(drop=True)
+
+def build_rate_grid(current_df, prev_df):
+    """today 를 객실 x 날짜 배열로 한 번 정렬하고, prev 대비 변화는 change-set 에서 얹어 모든 표가 위치로 읽도록 함"""
+    cur = current_df if 'Bar' in current_df.columns else compute_final_values(current_df)
+    changes = compute_change_set(cur, prev_df)
+    dates = sorted(cur['Date'].unique()) if not cur.empty else []
+    rooms = ALL_ROOMS + ([r for r in pd.unique(cur['RoomID']) if r not in ALL_ROOMS] if not cur.empty else [])
+    room_index, date_index = pd.Index(rooms), pd.Index(dates)
+
+    has, curr_arrays = _place_on_grid(cur, room_index, date_index, GRID_FIELDS)
+    _, change_arrays = _place_on_grid(changes, room_index, date_index, {"Pickup": 0.0, "BarChanged": False})
+    return {
+        "dates": dates,
+        "rooms": rooms,
+        "room_pos": {r: i for i, r in enumerate(rooms)},
+        "has": has,
+        **curr_arrays,
+        **change_arrays,
+        "changes": changes,
+    }
+
+# --- 2-3. 채널 판매가 행렬 ---
+def item_price_terms(item):
+    """상품 설정 -> (할인율 %, 추가금). 비었거나 잘못된 값은 0"""
+    try: discount = float(item.get('할인(%)') or 0)
+    except: discount = 0.0
+    try: add_price = int(item.get('추가금') or 0)
+    except: add_price = 0
+    return (0.0 if math.isnan(discount) else discount), add_price
+
+def channel_price_rows(grid, items):
+    """상품 x 날짜 최종 판매가: floor(기본가 x (1 - 할인) / 1000) x 1000 + 추가금, 값 없는 칸은 NaN"""
+    if not items: return np.zeros((0, len(grid["dates"])))
+    room_pos = np.array([grid["room_pos"].get(item.get('객실타입', 'Unknown'), -1) for item in items])
+    terms = np.array([item_price_terms(item) for item in items], dtype=float)
+    base = np.where(grid["has"], grid["Price"], np.nan)[room_pos.clip(0)]
+    prices = np.floor(base * (1 - terms[:, :1] / 100) / 1000) * 1000 + terms[:, 1:]
+    prices[room_pos < 0] = np.nan
+    return prices
+
+def sell_price_matrix(grid, promotions, channel_list):
+    """전 채널 (채널, 객실타입, 상품명) x 날짜 판매가를 한 번의 브로드캐스트로 계산"""
+    items = [(ch, item) for ch in channel_list for item in promotions.get(ch, {}).get("items", [])]
+    prices = channel_price_rows(grid, [item for _, item in items])
+    index = pd.MultiIndex.from_arrays(
+        [[ch for ch, _ in items], [item.get('객실타입', 'Unknown') for _, item in items], [item.get('상품명', 'No Name') for _, item in items]],
+        names=["채널", "객실타입", "상품명"],
+    )
+    return pd.DataFrame(prices, index=index, columns=grid["dates"])
+
+def _excel_sheet_name(name, used):
+    base = re.sub(r'[\[\]:*?/\\]', '_', str(name))[:31] or "sheet"
+    sheet, n = base, 1
+    while sheet in used:
+        n += 1
+        sheet = f"{base[:28]}_{n}"
+    used.add(sheet)
+    return sheet
+
+def export_sell_prices(matrix, fmt="xlsx", channel_list=None):
+    """판매가 행렬 -> 채널별 시트 xlsx 또는 전 채널 CSV 1개 (bytes)
+    channel_list 를 주면 상품이 없는 채널도 머리글만 있는 시트로 남김 (행렬이 비어 있으면 호출하지 말 것)"""
+    table = matrix.astype("Int64").rename(columns=lambda d: d.isoformat())
+    if fmt == "csv":
+        return table.reset_index().to_csv(index=False).encode("utf-8-sig")
+    by_channel = {ch: sub.droplevel(0) for ch, sub in table.groupby(level=0, sort=False)}
+    empty = table.iloc[:0].droplevel(0)
+    buf, used = io.BytesIO(), set()
+    with pd.ExcelWriter(buf, engine="openpyxl") as writer:
+        for ch in channel_list if channel_list is not None else by_channel:
+            by_channel.get(ch, empty).to_excel(writer, sheet_name=_excel_sheet_name(ch, used))
+    return buf.getvalue()
+
+# --- 3. 렌더러 ---
+# 셀마다 inline style 을 반복하지 않도록 공통 CSS 클래스로 정의 (페이지에 한 번만 주입)
+RATE_TABLE_CSS = "".join([
+    ".rt-title{margin-top:40px; margin-bottom:10px; font-weight:bold; font-size:18px; padding:10px; background:#f0f2f6; border-left:10px solid #000;}",
+    ".rt-wrap{overflow-x:auto; white-space:nowrap; border:1px solid #ddd;}",
+    ".rt-table{width:100%; border-collapse:collapse; font-size:11px; min-width:1000px;}",
+    ".rt-table thead tr{background:#f9f9f9;}",
+    ".rt-table th{border:1px solid #ddd; padding:5px; color:black;}",
+    ".rt-table th.rt-corner{width:180px; position:sticky; left:0; background:#f9f9f9; z-index:2;}",
+    ".rt-table th.wd-sun{color:red;} .rt-table th.wd-sat{color:blue;}",
+    ".rt-table td{border:1px solid #ddd; padding:8px; text-align:center; background-color:white;}",
+    ".rt-table td.rt-label{text-align:left; background:#fff; border-right:4px solid #000; position:sticky; left:0; z-index:1;}",
+    ".rt-table tr.rt-sep{border-bottom:3.4px solid #000;}",
+    ".rt-sell th{padding:2px; min-width:45px;} .rt-sell td{padding:1px; line-height:1.0; font-size:11px;}",
+    ".rt-prod{color:blue; margin-left:4px;}",
+    ".rt-table td.up{color:red; font-weight:bold; border:1.5px solid red;}",
+    ".rt-table td.down{color:blue; font-weight:bold;}",
+    ".rt-table td.chg{color:white; font-weight:bold; border:2.5px solid #000;}",
+    ".rt-sell td.chg{border-color:#333;}",
+    ".rt-table td.g-fixed{background-color:#F1F1F1;}",
+    ".rt-table td.g-x{background-color:#7000FF;}",
+    *[f".rt-table td.g-{bar}{{background-color:{color};}}" for bar, color in BAR_GRADIENT_COLORS.items()],
+    *[f".rt-table td.l-{bar}{{background-color:{color};}}" for bar, color in BAR_LIGHT_COLORS.items()],
+])
+SEPARATOR_ROOMS = ["HDF", "PPV"]
+
+def _bar_class(prefix, bar, fallback=""):
+    return f"{prefix}-{bar}" if bar in BAR_GRADIENT_COLORS else fallback
+
+def render_master_table(current_df, prev_df, ch_name=None, title="", mode="기준", grid=None, window=None, items=None):
+    """window=(시작, 끝) 은 정렬된 날짜 인덱스 범위로, 해당 구간의 열만 그림 (None 이면 전체)
+    items 는 판매가 모드에서 그릴 채널 상품 목록 (promotions[ch_name]["items"])"""
+    if current_df.empty: return "<div style='padding:20px;'>데이터를 업로드하세요.</div>"
+    if grid is None: grid = build_rate_grid(current_df, prev_df)
+    lo, hi = window if window is not None else (0, len(grid["dates"]))
+    cols = range(lo, min(hi, len(grid["dates"])))
+    
+    if mode == "판매가":
+        items_to_show = items or []
+        table_class = "rt-table rt-sell"
+    else:
+        items_to_show = ALL_ROOMS
+        table_class = "rt-table"
+
+    if mode == "판매가" and not items_to_show:
+        return f"<div style='padding:10px; color:gray;'>👉 사이드바에서 {ch_name} 상품을 추가해주세요.</div>"
+
+    out = [f"<div class='rt-title'>{title}</div><div class='rt-wrap'>"]
+    out.append(f"<table class='{table_class}'><thead><tr><th rowspan='2' class='rt-corner'>객실/프로모션</th>")
+    out.extend(f"<th>{grid['dates'][ci].strftime('%m-%d')}</th>" for ci in cols)
+    out.append("</tr><tr>")
+    for ci in cols:
+        wd = WEEKDAYS_KR[grid["dates"][ci].weekday()]
+        out.append(f"<th class='wd-sun'>{wd}</th>" if wd == '일' else (f"<th class='wd-sat'>{wd}</th>" if wd == '토' else f"<th>{wd}</th>"))
+    out.append("</tr></thead><tbody>")
+
+    if mode == "판매가": item_prices = channel_price_rows(grid, items_to_show)
+
+    for item_i, item in enumerate(items_to_show):
+        if mode == "판매가":
+            rid = item.get('객실타입', 'Unknown')
+            label_text = item.get('상품명', 'No Name')
+            label = f"<b>{rid}</b> <span class='rt-prod'>: {label_text}</span>"
+        else:
+            rid = item
+            label = f"<b>{rid}</b>" if rid in SEPARATOR_ROOMS else rid
+
+        out.append("<tr class='rt-sep'>" if rid in SEPARATOR_ROOMS else "<tr>")
+        out.append(f"<td class='rt-label'>{label}</td>")
+        
+        ri = grid["room_pos"].get(rid)
+        for ci in cols:
+            if ri is None or not grid["has"][ri, ci]:
+                out.append("<td>-</td>")
+                continue
+
+            occ, bar, base_price = grid["Occ"][ri, ci], grid["Bar"][ri, ci], grid["Price"][ri, ci]
+            # prev 대비 변화는 change-set 에서 온 값만 사용
+            pickup, bar_changed = grid["Pickup"][ri, ci], grid["BarChanged"][ri, ci]
+
+            cls = ""
+            if mode == "기준":
+                cls = _bar_class("g", bar) if rid in DYNAMIC_ROOMS else "g-fixed"
+                content = f"<b>{bar}</b><br>{base_price:,}<br>{occ:.0f}%"
+            
+            elif mode == "변화":
+                cls = _bar_class("l", bar) if rid in DYNAMIC_ROOMS else ""
+                if pickup > 0:
+                    cls += " up"
+                    content = f"+{pickup:.0f}"
+                elif pickup < 0:
+                    cls += " down"
+                    content = f"{pickup:.0f}"
+                else: content = "-"
+            
+            elif mode == "판도변화":
+                # 이전 데이터가 있고, BAR 가 다를 때만 색칠
+                if bar_changed:
+                    cls = f"chg {_bar_class('g', bar, 'g-x')}"
+                    content = f"▲ {bar}"
+                else: 
+                    # 같으면 흰색 유지
+                    content = bar
+            
+            elif mode == "판매가":
+                final_p = int(item_prices[item_i, ci])
+                content = f"<b>{final_p:,}</b>"
+                if bar_changed:
+                    cls = f"chg {_bar_class('g', bar, 'g-x')}"
+
+            cls = cls.strip()
+            out.append(f"<td class='{cls}'>{content}</td>" if cls else f"<td>{content}</td>")
+        out.append("</tr>")
+    out.append("</tbody></table></div>")
+    return "".join(out)
+
+# --- 3-1. 렌더 캐시 (내용 기반 키 + LRU) ---
+RENDER_CACHE_SIZE = 64
+
+def frame_fingerprint(df):
+    """프레임 내용 해시: 값이 같으면 리런/재로드와 무관하게 같은 키"""
+    if df.empty: return "empty"
+    h = hashlib.sha1(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    h.update("|".join(map(str, df.columns)).encode())
+    return h.hexdigest()
+
+def render_cache_key(data_key, mode, title, ch_name=None, items=None, window=None):
+    payload = json.dumps([data_key, mode, title, ch_name, items, window], sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+def get_cached_html(cache, key, render_fn, max_size=RENDER_CACHE_SIZE):
+    if key in cache:
+        cache.move_to_end(key)
+        return cache[key]
+    html = render_fn()
+    cache[key] = html
+    while len(cache) > max_size: cache.popitem(last=False)
+    return html
+
+# --- 4. 파서 및 병합 ---
+def robust_date_parser(d_val, year=None):
+    if pd.isna(d_val): return None
+    try:
+        if isinstance(d_val, datetime): return d_val.date()
+        if isinstance(d_val, date): return d_val
+        if isinstance(d_val, (int, float)): return (pd.to_datetime('1899-12-30') + pd.to_timedelta(d_val, 'D')).date()
+        s = str(d_val).strip().replace('.', '-').replace('/', '-').replace(' ', '')
+        full = re.search(r'(\d{4})-(\d{1,2})-(\d{1,2})', s)
+        if full: return date(int(full.group(1)), int(full.group(2)), int(full.group(3)))
+        match = re.search(r'(\d{1,2})-(\d{1,2})', s)
+        if match: return date(year or date.today().year, int(match.group(1)), int(match.group(2)))
+    except: pass
+    return None
+
+def parse_report_dates(values, base_year):
+    """헤더 날짜 행 파싱: 연도 없는 MM-DD 는 base_year 에서 시작해 날짜가 거꾸로 가면 다음 해로 넘김"""
+    parsed, year, last = [], base_year, None
+    for v in values:
+        d_obj = robust_date_parser(v, year)
+        if d_obj is not None and last is not None and d_obj < last:
+            rolled = robust_date_parser(v, year + 1)
+            if rolled != d_obj: year, d_obj = year + 1, rolled
+        if d_obj is not None: last = d_obj
+        parsed.append(d_obj)
+    return parsed
+
+def report_base_year(date_tag):
+    """파일명 YYYYMMDD 태그의 연도, 없으면 올해"""
+    try: return datetime.strptime(date_tag, "%Y%m%d").year
+    except ValueError: return date.today().year
+
+def report_date_tag(file_name):
+    match = re.search(r'\d{8}', file_name)
+    return match.group() if match else file_name
+
+REPORT_HEADER_ROW = 2   # 0-based: 날짜 행
+REPORT_DATA_COL = 2     # 0-based: 날짜/잔여객실 시작 열 (1열은 총 객실수)
+PARSE_WORKERS = 4
+PARSE_POOL_MIN_BYTES = 1_000_000   # 합계가 이보다 작으면 직렬 파싱 (워커 기동 ~1초 > 파싱 시간, 약 2ms/KB)
+
+def read_report_rows(data, rows):
+    """필요한 행만 {행번호: 값 리스트} 로 읽음 (xlsx: openpyxl read-only 스트리밍, xls: xlrd on_demand)"""
+    rows = set(rows)
+    if data[:4] == b'\xd0\xcf\x11\xe0':
+        import xlrd
+        book = xlrd.open_workbook(file_contents=data, on_demand=True)
+        try:
+            sheet = book.sheet_by_index(0)
+            return {r: sheet.row_values(r) for r in rows if r < sheet.nrows}
+        finally:
+            book.release_resources()
+    import openpyxl
+    wb = openpyxl.load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        # 생성기가 <dimension> 을 잘못 쓰는 경우가 많아 pandas 처럼 무시하고 실제 셀 기준으로 읽음
+        ws.reset_dimensions()
+        # max_row 까지만 파싱하고 멈추므로 시트 나머지는 읽지 않음
+        it = ws.iter_rows(min_row=1, max_row=max(rows) + 1, values_only=True)
+        return {r: list(values) for r, values in enumerate(it) if r in rows}
+    finally:
+        wb.close()
+
+def parse_report(file_name, data):
+    """업로드 리포트 1개 -> Date/RoomID/Available/Total/Tag long-format 프레임"""
+    date_tag = report_date_tag(file_name)
+    raw = read_report_rows(data, [REPORT_HEADER_ROW, *ROW_MAP])
+    header = raw.get(REPORT_HEADER_ROW, [])[REPORT_DATA_COL:]
+    dates = np.array(parse_report_dates(header, report_base_year(date_tag)), dtype=object)
+    valid = pd.notna(dates)
+    n_dates = len(header)
+
+    room_ids, totals, cells = [], [], []
+    for r_idx, rid in ROW_MAP.items():
+        values = raw.get(r_idx)
+        # 비어 있는 객실 행은 건너뜀
+        if not values or all(v is None or v == '' for v in values): continue
+        row = list(values[REPORT_DATA_COL:REPORT_DATA_COL + n_dates])
+        room_ids.append(rid)
+        totals.append(values[1] if len(values) > 1 else None)
+        cells.append(row + [None] * (n_dates - len(row)))
+    if not room_ids or not valid.any():
+        return pd.DataFrame(columns=["Date", "RoomID", "Available", "Total", "Tag"])
+
+    # 잔여객실은 객실 x 날짜 행렬 한 번에 숫자 변환
+    avail = pd.to_numeric(pd.Series(np.array(cells, dtype=object)[:, valid].ravel()), errors='coerce')
+    total = pd.to_numeric(pd.Series(totals, dtype=object), errors='coerce').to_numpy()
+    n_valid = int(valid.sum())
+    return pd.DataFrame({
+        "Date": np.tile(dates[valid], len(room_ids)),
+        "RoomID": np.repeat(room_ids, n_valid),
+        "Available": avail.to_numpy(),
+        "Total": np.repeat(total, n_valid),
+        "Tag": date_tag,
+    })
+
+# 워커는 spawn 으로 새로 띄움: Streamlit 서버(gRPC Firestore 클라이언트, write-behind/Tornado 스레드)를 fork 하지 않도록
+WORKER_CONTEXT = multiprocessing.get_context("spawn")
+
+def _parse_report_args(upload):
+    return parse_report(*upload)
+
+_pool, _pool_workers = None, 0
+_pool_lock = threading.Lock()
+
+def worker_pool(workers):
+    """프로세스 수명 동안 재사용하는 spawn 풀 (처음 필요할 때 만들고, 더 많은 워커가 필요할 때만 다시 만듦)"""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers < workers:
+            if _pool is not None: _pool.shutdown(wait=False)
+            _pool, _pool_workers = ProcessPoolExecutor(max_workers=workers, mp_context=WORKER_CONTEXT), workers
+        return _pool
+
+def _reset_pool(pool):
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is pool: _pool, _pool_workers = None, 0
+
+def parse_reports(uploads, workers=PARSE_WORKERS):
+    """[(파일명, bytes)] 를 파싱해 입력 순서대로 반환 (파일이 여럿이고 합계가 PARSE_POOL_MIN_BYTES 이상일 때만 프로세스 풀 사용)"""
+    workers = min(workers, len(uploads), os.cpu_count() or 1)
+    if workers <= 1 or sum(len(data) for _, data in uploads) < PARSE_POOL_MIN_BYTES:
+        return [parse_report(name, data) for name, data in uploads]
+    pool = worker_pool(workers)
+    try: return list(pool.map(_parse_report_args, uploads))
+    except BrokenProcessPool:
+        # 워커가 죽은 풀은 다시 쓸 수 없으므로 버리고 이번 요청은 직렬로 처리
+        logger.warning("파싱 워커 풀이 중단되어 직렬로 파싱합니다")
+        _reset_pool(pool)
+        return [parse_report(name, data) for name, data in uploads]
+
+def upload_key(file_name, data):
+    """업로드 식별자: 파일명 + 내용 해시 (같은 파일이 다시 올라와도 재파싱하지 않음)"""
+    h = hashlib.sha1(data)
+    h.update(file_name.encode())
+    return h.hexdigest()
+
+def upsert_rows(base_df, new_df):
+    """(Date, RoomID) 키 기준 upsert: new_df 행이 base_df 의 같은 키를 대체"""
+    keys = ['Date', 'RoomID']
+    new_df = new_df.drop_duplicates(subset=keys, keep='first')
+    if base_df.empty: return new_df.sort_values(by=keys).reset_index(drop=True)
+    base = base_df.set_index(keys)
+    new = new_df.set_index(keys)
+    kept = base[~base.index.isin(new.index)]
+    return pd.concat([new, kept]).sort_index().reset_index()
+
+# --- 4-1. 스냅샷 포맷 (열 기반 + 압축, prev 는 참조 또는 희소 델타) ---
+SNAPSHOT_FORMAT = 2
+SNAPSHOT_COLUMNS = ["Date", "RoomID", "Available", "Total", "Tag"]
+
+def _pack(arr):
+    return zlib.compress(np.ascontiguousarray(arr).tobytes(), 6)
+
+def _unpack(blob, dtype, shape=None):
+    arr = np.frombuffer(zlib.decompress(bytes(blob)), dtype=dtype)
+    return arr.reshape(shape) if shape is not None else arr
+
+def _frame_to_arrays(df, room_index, start, n_days):
+    """(Date, RoomID) 행 -> 객실 x 일자 배열 (mask / avail / total / tag 인덱스)"""
+    shape = (len(room_index), n_days)
+    arrays = {
+        "mask": np.zeros(shape, dtype=bool),
+        "avail": np.full(shape, np.nan, dtype=np.float32),
+        "total": np.full(shape, np.nan, dtype=np.float32),
+        "tag": np.full(shape, -1, dtype=np.int32),
+    }
+    if df.empty: return arrays, []
+    df = df.drop_duplicates(subset=['Date', 'RoomID'], keep='first')
+    r = room_index.get_indexer(df['RoomID'])
+    c = (pd.to_datetime(df['Date']).to_numpy().astype('datetime64[D]') - start).astype(np.int64)
+    tag_codes, tag_vocab = pd.factorize(df['Tag']) if 'Tag' in df.columns else (np.full(len(df), -1), [])
+    arrays["mask"][r, c] = True
+    arrays["avail"][r, c] = pd.to_numeric(df['Available'], errors='coerce').to_numpy(dtype=float)
+    arrays["total"][r, c] = pd.to_numeric(df['Total'], errors='coerce').to_numpy(dtype=float)
+    arrays["tag"][r, c] = tag_codes
+    return arrays, [str(t) for t in tag_vocab]
+
+def _encode_totals(total, mask):
+    """객실별 Total 이 날짜와 무관하게 같으면 벡터로, 아니면 행렬로 저장"""
+    vector = []
+    for row, present in zip(total, mask):
+        vals = np.unique(row[present])
+        if len(vals) > 1: return {"total_matrix": _pack(total)}
+        vector.append(float(vals[0]) if len(vals) and not np.isnan(vals[0]) else None)
+    return {"total": vector}
+
+def _decode_totals(enc, shape):
+    if "total_matrix" in enc: return _unpack(enc["total_matrix"], np.float32, shape)
+    vector = np.array([np.nan if v is None else v for v in enc["total"]], dtype=np.float32)
+    return np.repeat(vector[:, None], shape[1], axis=1)
+
+def _arrays_to_frame(mask, avail, total, tag, tag_vocab, rooms, start):
+    """배열 -> Date/RoomID 정렬된 long 프레임 (dict 리스트를 거치지 않음)"""
+    # rooms 축이 정렬돼 있으므로 (일자, 객실) 순 nonzero 가 곧 Date, RoomID 정렬 순서
+    day_idx, room_idx = np.nonzero(mask.T)
+    vocab = np.asarray(list(tag_vocab) + [None], dtype=object)
+    return pd.DataFrame({
+        "Date": (start + day_idx).astype(object),
+        "RoomID": np.asarray(rooms, dtype=object)[room_idx],
+        "Available": avail[room_idx, day_idx].astype(float),
+        "Total": total[room_idx, day_idx].astype(float),
+        "Tag": vocab[tag[room_idx, day_idx]],
+    })
+
+def encode_snapshot(today_df, prev_df, prev_ref=None):
+    """today 는 열 기반 압축 그리드로, prev 는 이전 스냅샷 참조(prev_ref) 또는 today 대비 희소 델타로 저장"""
+    frames = [df for df in (today_df, prev_df) if not df.empty]
+    all_dates = pd.to_datetime(pd.concat([df['Date'] for df in frames])).to_numpy().astype('datetime64[D]') if frames else np.array([], dtype='datetime64[D]')
+    start = all_dates.min() if len(all_dates) else np.datetime64(date.today(), 'D')
+    n_days = int((all_dates.max() - start).astype(np.int64)) + 1 if len(all_dates) else 0
+    rooms = sorted(set().union(*[set(df['RoomID']) for df in frames])) if frames else []
+    room_index = pd.Index(rooms)
+
+    today, today_vocab = _frame_to_arrays(today_df, room_index, start, n_days)
+    doc = {
+        "format": SNAPSHOT_FORMAT,
+        "grid": {
+            "start": str(start), "days": n_days, "rooms": rooms,
+            "mask": _pack(np.packbits(today["mask"])),
+            "avail": _pack(today["avail"]),
+            "tag_vocab": today_vocab, "tag": _pack(today["tag"]),
+            **_encode_totals(today["total"], today["mask"]),
+        },
+    }
+    if prev_df.empty: return doc
+    if prev_ref:
+        doc["prev_ref"] = prev_ref
+        return doc
+
+    prev, prev_vocab = _frame_to_arrays(prev_df, room_index, start, n_days)
+    mask_diff = np.flatnonzero(prev["mask"].ravel() != today["mask"].ravel())
+    p_av, t_av = prev["avail"].ravel(), today["avail"].ravel()
+    changed = np.flatnonzero(prev["mask"].ravel() & (p_av != t_av) & ~(np.isnan(p_av) & np.isnan(t_av)))
+    doc["prev_delta"] = {
+        "mask_diff": _pack(mask_diff.astype(np.int32)),
+        "avail_idx": _pack(changed.astype(np.int32)),
+        "avail_val": _pack(p_av[changed]),
+        "tag_vocab": prev_vocab, "tag": _pack(prev["tag"]),
+        **_encode_totals(prev["total"], prev["mask"]),
+    }
+    return doc
+
+def _legacy_rows_to_frame(rows):
+    df = pd.DataFrame(rows)
+    if not df.empty and 'Date' in df.columns:
+        df['Date'] = pd.to_datetime(df['Date']).dt.date
+    return df
+
+def decode_snapshot(d_dict, resolve_ref=None, with_prev=True):
+    """스냅샷 문서 -> (today_df, prev_df). 구버전(data/prev_data 행 dict 리스트)도 읽음
+    resolve_ref(doc_id) 는 prev_ref 가 가리키는 스냅샷의 today_df 를 돌려줘야 함"""
+    if "grid" not in d_dict:
+        today_df = _legacy_rows_to_frame(d_dict.get('data', []))
+        prev_df = _legacy_rows_to_frame(d_dict['prev_data']) if with_prev and d_dict.get('prev_data') else pd.DataFrame()
+        return today_df, prev_df
+
+    g = d_dict["grid"]
+    shape = (len(g["rooms"]), g["days"])
+    start = np.datetime64(g["start"], 'D')
+    mask = np.unpackbits(_unpack(g["mask"], np.uint8), count=shape[0] * shape[1]).astype(bool).reshape(shape)
+    avail = _unpack(g["avail"], np.float32, shape)
+    today_df = _arrays_to_frame(mask, avail, _decode_totals(g, shape), _unpack(g["tag"], np.int32, shape), g["tag_vocab"], g["rooms"], start)
+    if not with_prev: return today_df, pd.DataFrame()
+
+    if d_dict.get("prev_ref"):
+        prev_df = resolve_ref(d_dict["prev_ref"]) if resolve_ref else pd.DataFrame()
+    elif "prev_delta" in d_dict:
+        p = d_dict["prev_delta"]
+        prev_mask = mask.ravel().copy()
+        prev_mask[_unpack(p["mask_diff"], np.int32)] ^= True
+        prev_avail = avail.ravel().copy()
+        prev_avail[_unpack(p["avail_idx"], np.int32)] = _unpack(p["avail_val"], np.float32)
+        prev_df = _arrays_to_frame(prev_mask.reshape(shape), prev_avail.reshape(shape), _decode_totals(p, shape), _unpack(p["tag"], np.int32, shape), p["tag_vocab"], g["rooms"], start)
+    else:
+        prev_df = pd.DataFrame()
+    return today_df, prev_df
+
+# --- 5. 예약 페이스 (스냅샷 x 객실 x 날짜 큐브) ---
+PACE_PICKUP_DAYS = 7
+
+def build_pace_cube(refs, docs):
+    """오래된 순 스냅샷들을 공통 객실/날짜 축에 쌓은 큐브 (avail / total / mask: S x R x D)"""
+    frames = [decode_snapshot(doc, with_prev=False)[0] for doc in docs]
+    dates = sorted(set().union(*[set(df['Date']) for df in frames if not df.empty]))
+    rooms = ALL_ROOMS + sorted(set().union(*[set(df['RoomID']) for df in frames if not df.empty]) - set(ALL_ROOMS))
+    room_index, date_index = pd.Index(rooms), pd.Index(dates)
+    fields = {"Available": np.nan, "Total": np.nan}
+    placed = [_place_on_grid(df, room_index, date_index, fields) for df in frames]
+    empty = np.zeros((0, len(rooms), len(dates)))
+    return {
+        "snapshot_ids": [r[0] for r in refs],
+        "save_times": [r[1] for r in refs],
+        "work_dates": [r[2] for r in refs],
+        "rooms": rooms,
+        "dates": dates,
+        "mask": np.stack([has for has, _ in placed]) if placed else empty.astype(bool),
+        "avail": np.stack([arr["Available"] for _, arr in placed]) if placed else empty,
+        "total": np.stack([arr["Total"] for _, arr in placed]) if placed else empty,
+    }
+
+def cube_sold(cube):
+    """판매 객실수 (Total - 잔여), 값이 없는 칸은 NaN"""
+    sold = cube["total"] - np.nan_to_num(cube["avail"], nan=0.0)
+    return np.where(cube["mask"], sold, np.nan)
+
+def pickup_curves(cube):
+    """날짜별 전체 객실 판매수의 스냅샷별 추이 (행: 스냅샷 work_date, 열: 투숙일), 그 스냅샷에 없던 투숙일은 NaN"""
+    sold = np.where(cube["mask"].any(axis=1), np.nansum(cube_sold(cube), axis=1), np.nan)
+    return pd.DataFrame(sold, index=cube["work_dates"], columns=cube["dates"])
+
+def n_day_pickup(cube, days=PACE_PICKUP_DAYS):
+    """최신 스냅샷 대비 days 일 전(그 이전 중 가장 가까운) 스냅샷의 객실 x 날짜 픽업과 실제 기준 스냅샷 work_date
+    days 일 이상 지난 스냅샷이 없으면 가장 오래된 스냅샷을 기준으로 하므로 기간이 더 짧을 수 있음"""
+    if not cube["snapshot_ids"]: return pd.DataFrame(), None
+    work_dates = pd.to_datetime(pd.Series(cube["work_dates"]), errors='coerce')
+    cutoff = work_dates.iloc[-1] - pd.Timedelta(days=days)
+    earlier = np.flatnonzero((work_dates <= cutoff).to_numpy())
+    base = earlier[-1] if len(earlier) else 0
+    sold = cube_sold(cube)
+    return pd.DataFrame(sold[-1] - sold[base], index=cube["rooms"], columns=cube["dates"]), cube["work_dates"][base]
+
+def bar_history(cube):
+    """큐브 전체에 BAR 판정을 한 번에 적용: (S x R x D) 가격코드 배열과 객실 x 날짜 BAR 변경 횟수"""
+    if not cube["dates"]: return np.zeros(cube["mask"].shape, dtype=object), pd.DataFrame()
+    calendar = get_season_calendar(cube["dates"][0], cube["dates"][-1])
+    season_idx, weekend_idx = calendar.lookup_many(cube["dates"])
+    room_idx = pd.Index(ALL_ROOMS).get_indexer(cube["rooms"])
+    occ = occupancy_pct(cube["avail"], cube["total"])
+    code_idx = price_code_index(occ, room_idx[None, :, None], season_idx[None, None, :], weekend_idx[None, None, :])
+    codes = np.where(cube["mask"], np.asarray(PRICE_CODES, dtype=object)[code_idx], None)
+    both = cube["mask"][1:] & cube["mask"][:-1]
+    changes = (both & (codes[1:] != codes[:-1])).sum(axis=0)
+    return codes, pd.DataFrame(changes, index=cube["rooms"], columns=cube["dates"])
@@ -0,0 +1,77 @@
+# 리런 진단: 단계별 소요 시간/건수, 저장소 호출 통계, 롤링 로그, cProfile 요약
+import io
+import json
+import logging
+import pstats
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from rate_store import StoreMeter, store_meters
+
+DIAG_LOG_BYTES = 1_000_000   # 로그 파일 하나의 최대 크기, 넘으면 .1 ~ .N 으로 회전
+DIAG_LOG_BACKUPS = 3
+PROFILE_TOP = 40             # cProfile 요약에 남길 함수 수 (누적 시간 순)
+
+class RunTrace:
+    """한 번의 리런 동안 단계(span)별 소요 시간과 건수를 모음. span 은 중첩 가능하며 depth 로 구분"""
+
+    def __init__(self):
+        self.at = datetime.now().isoformat(timespec="seconds")
+        self.started = time.perf_counter()
+        self.spans = []
+        self._depth = 0
+
+    @contextmanager
+    def span(self, phase, **counts):
+        # 건수는 블록 안에서 yield 된 dict 에 채워 넣을 수 있음
+        entry = {"phase": phase, "depth": self._depth, **counts}
+        self.spans.append(entry)
+        self._depth += 1
+        t0 = time.perf_counter()
+        try: yield entry
+        finally:
+            entry["ms"] = round((time.perf_counter() - t0) * 1000, 2)
+            self._depth -= 1
+
+    def elapsed_ms(self):
+        return round((time.perf_counter() - self.started) * 1000, 2)
+
+def meter_stats(store):
+    """{백엔드 이름: {메서드: (호출, 문서, ms)}} 누적값"""
+    return {meter.name: meter.stats() for meter in store_meters(store)}
+
+def store_delta(before, after):
+    """두 누적값의 차이 -> 이번 리런의 백엔드/메서드별 호출 행 (여러 세션이 동시에 돌면 그 호출도 섞임)"""
+    rows = []
+    for backend, stats in after.items():
+        for op, (calls, docs, ms) in stats.items():
+            c0, d0, m0 = before.get(backend, {}).get(op, (0, 0, 0.0))
+            if calls == c0: continue
+            rows.append({
+                "backend": backend, "op": op, "kind": "write" if op in StoreMeter.WRITES else "read",
+                "calls": calls - c0, "docs": docs - d0, "ms": round(ms - m0, 2),
+            })
+    return rows
+
+def _diag_logger(path):
+    logger = logging.getLogger(f"purehill.diag.{path}")
+    if not logger.handlers:
+        try: handler = RotatingFileHandler(path, maxBytes=DIAG_LOG_BYTES, backupCount=DIAG_LOG_BACKUPS, encoding="utf-8")
+        except OSError: return None
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return logger
+
+def append_diag_log(path, record):
+    """리런 기록을 JSON 한 줄로 롤링 로그에 추가 (파일을 열 수 없으면 조용히 건너뜀)"""
+    logger = _diag_logger(path)
+    if logger: logger.info(json.dumps(record, ensure_ascii=False, default=str))
+
+def profile_report(profiler, top=PROFILE_TOP):
+    """cProfile 결과 -> 누적 시간 상위 top 개 함수 텍스트"""
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).strip_dirs().sort_stats("cumulative").print_stats(top)
+    return out.getvalue()
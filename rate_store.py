@@ -0,0 +1,323 @@
+# 스냅샷/채널 설정 저장소: Firestore, 로컬 SQLite, 그리고 둘을 묶은 읽기 캐시 + write-behind
+import base64
+import copy
+import functools
+import json
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+# 모든 백엔드가 같은 메서드를 제공:
+#   load_channel_configs() / save_channel_configs(configs)
+#   save_snapshot(doc_id, doc) / load_snapshot(doc_id)
+#   load_snapshots(doc_ids) -> [doc | None] (한 번에 일괄 조회)
+#   find_snapshot_id(work_date) / latest_snapshot_ref() -> (doc_id, save_time)
+#   recent_snapshot_refs(n) -> [(doc_id, save_time, work_date)] (최신순) / drain_errors()
+SNAPSHOT_COLLECTION = "daily_snapshots"
+WRITE_RETRY_BASE = 2.0    # 일시 장애로 실패한 write-behind 재시도 간격 (초), 실패할 때마다 두 배
+WRITE_RETRY_MAX = 60.0
+WRITE_RETRY_LIMIT = 8     # 이 횟수만큼 시도해도 안 되면 포기 (로컬 캐시에는 이미 저장돼 있음)
+
+def is_transient_error(exc):
+    """네트워크/일시 장애처럼 다시 시도하면 될 수 있는 오류인지 (권한, 문서 크기 초과 등은 False)"""
+    if isinstance(exc, (ConnectionError, TimeoutError)): return True
+    try: from google.api_core import exceptions as gexc
+    except ImportError: return False
+    return isinstance(exc, (gexc.ServiceUnavailable, gexc.DeadlineExceeded, gexc.InternalServerError, gexc.TooManyRequests, gexc.Aborted))
+
+def new_snapshot_id():
+    return uuid.uuid4().hex
+
+def _doc_to_json(doc):
+    # 스냅샷 그리드는 bytes 필드를 포함하므로 base64 로 감싸서 저장
+    return json.dumps(doc, ensure_ascii=False, default=lambda o: {"__bytes__": base64.b64encode(bytes(o)).decode()})
+
+def _doc_from_json(text):
+    return json.loads(text, object_hook=lambda o: base64.b64decode(o["__bytes__"]) if set(o) == {"__bytes__"} else o)
+
+class FirestoreStore:
+    def __init__(self, client):
+        from firebase_admin import firestore
+        self.db = client
+        self.descending = firestore.Query.DESCENDING
+
+    def load_channel_configs(self):
+        doc = self.db.collection("settings").document("channels").get()
+        return doc.to_dict() if doc.exists else {}
+
+    def save_channel_configs(self, configs):
+        self.db.collection("settings").document("channels").set(configs)
+
+    def save_snapshot(self, doc_id, doc):
+        self.db.collection(SNAPSHOT_COLLECTION).document(doc_id).set(doc)
+
+    def load_snapshot(self, doc_id):
+        doc = self.db.collection(SNAPSHOT_COLLECTION).document(doc_id).get()
+        return doc.to_dict() if doc.exists else None
+
+    def load_snapshots(self, doc_ids):
+        refs = [self.db.collection(SNAPSHOT_COLLECTION).document(i) for i in doc_ids]
+        found = {doc.id: doc.to_dict() for doc in self.db.get_all(refs) if doc.exists}
+        return [found.get(i) for i in doc_ids]
+
+    def find_snapshot_id(self, work_date):
+        # 본문 없이 문서 id 만 받는 projection 쿼리
+        docs = self.db.collection(SNAPSHOT_COLLECTION).where("work_date", "==", work_date).limit(1).select(["save_time"]).stream()
+        for doc in docs: return doc.id
+        return None
+
+    def latest_snapshot_ref(self):
+        docs = self.db.collection(SNAPSHOT_COLLECTION).order_by("save_time", direction=self.descending).limit(1).select(["save_time"]).stream()
+        for doc in docs: return doc.id, doc.to_dict().get("save_time")
+        return None
+
+    def snapshot_ref_before(self, work_date):
+        docs = self.db.collection(SNAPSHOT_COLLECTION).where("work_date", "<", work_date).order_by("work_date", direction=self.descending).limit(1).select(["save_time", "work_date"]).stream()
+        for doc in docs: return doc.id, doc.get("save_time"), doc.get("work_date")
+        return None
+
+    def recent_snapshot_refs(self, n):
+        docs = self.db.collection(SNAPSHOT_COLLECTION).order_by("save_time", direction=self.descending).limit(n).select(["save_time", "work_date"]).stream()
+        return [(doc.id, doc.get("save_time"), doc.get("work_date")) for doc in docs]
+
+    def drain_errors(self):
+        return []
+
+class SQLiteStore:
+    """로컬 SQLite 저장소: Firebase 없이 단독 사용하거나 Firestore 앞의 읽기 캐시로 사용"""
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.conn:
+            if path != ":memory:": self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, body TEXT NOT NULL)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS snapshots (id TEXT PRIMARY KEY, work_date TEXT, save_time TEXT, body TEXT NOT NULL)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_snapshots_work_date ON snapshots(work_date)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_snapshots_save_time ON snapshots(save_time)")
+
+    def _one(self, sql, args=()):
+        with self.lock:
+            return self.conn.execute(sql, args).fetchone()
+
+    def load_channel_configs(self):
+        row = self._one("SELECT body FROM settings WHERE key = 'channels'")
+        return _doc_from_json(row[0]) if row else {}
+
+    def save_channel_configs(self, configs):
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO settings (key, body) VALUES ('channels', ?)", (_doc_to_json(configs),))
+
+    def save_snapshot(self, doc_id, doc):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO snapshots (id, work_date, save_time, body) VALUES (?, ?, ?, ?)",
+                (doc_id, doc.get("work_date"), doc.get("save_time"), _doc_to_json(doc)),
+            )
+
+    def load_snapshot(self, doc_id):
+        row = self._one("SELECT body FROM snapshots WHERE id = ?", (doc_id,))
+        return _doc_from_json(row[0]) if row else None
+
+    def load_snapshots(self, doc_ids):
+        found = {}
+        for i in range(0, len(doc_ids), 500):   # SQLite 바인딩 변수 개수 제한
+            chunk = doc_ids[i:i + 500]
+            with self.lock:
+                rows = self.conn.execute(f"SELECT id, body FROM snapshots WHERE id IN ({','.join('?' * len(chunk))})", chunk).fetchall()
+            found.update((doc_id, _doc_from_json(body)) for doc_id, body in rows)
+        return [found.get(i) for i in doc_ids]
+
+    def find_snapshot_id(self, work_date):
+        row = self._one("SELECT id FROM snapshots WHERE work_date = ? LIMIT 1", (work_date,))
+        return row[0] if row else None
+
+    def latest_snapshot_ref(self):
+        row = self._one("SELECT id, save_time FROM snapshots ORDER BY save_time DESC LIMIT 1")
+        return (row[0], row[1]) if row else None
+
+    def snapshot_ref_before(self, work_date):
+        row = self._one("SELECT id, save_time, work_date FROM snapshots WHERE work_date < ? ORDER BY work_date DESC, save_time DESC LIMIT 1", (work_date,))
+        return tuple(row) if row else None
+
+    def recent_snapshot_refs(self, n):
+        with self.lock:
+            rows = self.conn.execute("SELECT id, save_time, work_date FROM snapshots ORDER BY save_time DESC LIMIT ?", (n,)).fetchall()
+        return [tuple(r) for r in rows]
+
+    def drain_errors(self):
+        return []
+
+class CachedStore:
+    """primary(Firestore) 앞에 로컬 캐시를 두는 저장소
+    - 읽기: 스냅샷 본문은 캐시 우선(read-through), 목록/최신 조회는 primary 의 id 만 받아옴
+    - 쓰기: 캐시에 즉시 기록하고 primary 쓰기는 백그라운드 스레드로 넘김(write-behind)"""
+
+    def __init__(self, primary, cache, write_behind=True):
+        self.primary, self.cache = primary, cache
+        self._errors = []
+        # 아직 primary 에 반영되지 않은 설정 쓰기 수와 설정 저장 세대 (읽기가 옛 값을 캐시에 되쓰지 않도록)
+        self._config_lock = threading.Lock()
+        self._config_pending, self._config_version = 0, 0
+        self._queue = queue.Queue() if write_behind else None
+        if write_behind: threading.Thread(target=self._drain, daemon=True).start()
+
+    def _drain(self):
+        while True:
+            fn, args = self._queue.get()
+            # 일시 장애는 같은 자리에서 재시도 (뒤의 쓰기가 앞지르지 않도록 순서 유지),
+            # 재시도해도 소용없는 오류나 한도를 넘긴 쓰기는 보고 후 버리고 다음 쓰기로 넘어감
+            delay = WRITE_RETRY_BASE
+            for attempt in range(1, WRITE_RETRY_LIMIT + 1):
+                try:
+                    fn(*args)
+                    break
+                except Exception as e:
+                    if not is_transient_error(e):
+                        self._errors.append(f"{fn.__name__}: {e} (재시도 불가, 로컬에만 저장됨)")
+                        break
+                    if attempt == WRITE_RETRY_LIMIT:
+                        self._errors.append(f"{fn.__name__}: {e} ({attempt}회 실패, 로컬에만 저장됨)")
+                        break
+                    if attempt == 1: self._errors.append(f"{fn.__name__}: {e} (재시도 중)")
+                    time.sleep(delay)
+                    delay = min(delay * 2, WRITE_RETRY_MAX)
+            if fn.__name__ == "save_channel_configs":
+                with self._config_lock: self._config_pending -= 1
+            self._queue.task_done()
+
+    def _write(self, fn, *args):
+        if self._queue is None: fn(*args)
+        # 호출자의 객체(세션 상태 등)가 나중에 바뀌어도 큐에 들어간 내용은 그대로이도록 깊은 복사
+        else: self._queue.put((fn, copy.deepcopy(args)))
+
+    def pending(self):
+        return self._queue.unfinished_tasks if self._queue is not None else 0
+
+    def flush(self, timeout=None):
+        """백그라운드 쓰기가 모두 끝날 때까지 대기, timeout 안에 못 끝나면 False"""
+        if self._queue is None: return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0: return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def drain_errors(self):
+        errors, self._errors = self._errors, []
+        return errors
+
+    def load_channel_configs(self):
+        # 설정 쓰기가 아직 큐에 있으면 primary 는 옛 값이므로 로컬 사본이 최신
+        with self._config_lock:
+            if self._config_pending: return self.cache.load_channel_configs()
+            version = self._config_version
+        try: configs = self.primary.load_channel_configs()
+        except Exception: return self.cache.load_channel_configs()   # 오프라인이면 마지막 로컬 사본
+        with self._config_lock:
+            # 읽는 동안 새 설정이 저장됐다면 방금 받은 값은 이미 옛 값
+            if self._config_pending or version != self._config_version: return self.cache.load_channel_configs()
+            self.cache.save_channel_configs(configs)
+        return configs
+
+    def save_channel_configs(self, configs):
+        with self._config_lock:
+            self._config_version += 1
+            self.cache.save_channel_configs(configs)
+            if self._queue is not None: self._config_pending += 1
+        self._write(self.primary.save_channel_configs, configs)
+
+    def save_snapshot(self, doc_id, doc):
+        self.cache.save_snapshot(doc_id, doc)
+        self._write(self.primary.save_snapshot, doc_id, doc)
+
+    def load_snapshot(self, doc_id):
+        doc = self.cache.load_snapshot(doc_id)
+        if doc is None:
+            doc = self.primary.load_snapshot(doc_id)
+            if doc is not None: self.cache.save_snapshot(doc_id, doc)
+        return doc
+
+    def load_snapshots(self, doc_ids):
+        docs = self.cache.load_snapshots(doc_ids)
+        missing = [i for i, doc in zip(doc_ids, docs) if doc is None]
+        if missing:
+            fetched = dict(zip(missing, self.primary.load_snapshots(missing)))
+            for doc_id, doc in fetched.items():
+                if doc is not None: self.cache.save_snapshot(doc_id, doc)
+            docs = [doc if doc is not None else fetched.get(i) for i, doc in zip(doc_ids, docs)]
+        return docs
+
+    def find_snapshot_id(self, work_date):
+        try: doc_id = self.primary.find_snapshot_id(work_date)
+        except Exception: doc_id = None
+        # 아직 primary 에 반영되지 않은 write-behind 저장분은 캐시에서 찾음
+        return doc_id or self.cache.find_snapshot_id(work_date)
+
+    def latest_snapshot_ref(self):
+        refs = [self.cache.latest_snapshot_ref()]
+        try: refs.append(self.primary.latest_snapshot_ref())
+        except Exception: pass
+        refs = [r for r in refs if r is not None]
+        return max(refs, key=lambda r: r[1] or "") if refs else None
+
+    def snapshot_ref_before(self, work_date):
+        refs = [self.cache.snapshot_ref_before(work_date)]
+        try: refs.append(self.primary.snapshot_ref_before(work_date))
+        except Exception: pass
+        refs = [r for r in refs if r is not None]
+        return max(refs, key=lambda r: (r[2] or "", r[1] or "")) if refs else None
+
+    def recent_snapshot_refs(self, n):
+        refs = {r[0]: r for r in self.cache.recent_snapshot_refs(n)}
+        try: refs.update((r[0], r) for r in self.primary.recent_snapshot_refs(n))
+        except Exception: pass
+        return sorted(refs.values(), key=lambda r: r[1] or "", reverse=True)[:n]
+
+def _doc_count(op, result):
+    # 쓰기는 호출당 문서 1건, 읽기는 실제로 돌려받은 문서만 (없음/실패 None 은 0, 목록은 None 이 아닌 항목 수)
+    if op in StoreMeter.WRITES: return 1
+    if result is None: return 0
+    if isinstance(result, list): return sum(r is not None for r in result)
+    return 1
+
+class StoreMeter:
+    """저장소 래퍼: 읽기/쓰기 메서드별 호출 수, 문서 수, 누적 지연(ms)을 집계 (write-behind 스레드에서 불려도 안전)"""
+    READS = {"load_channel_configs", "load_snapshot", "load_snapshots", "find_snapshot_id", "latest_snapshot_ref", "snapshot_ref_before", "recent_snapshot_refs"}
+    WRITES = {"save_channel_configs", "save_snapshot"}
+
+    def __init__(self, store, name):
+        self.store, self.name = store, name
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def __getattr__(self, attr):
+        fn = getattr(self.store, attr)
+        if attr not in self.READS and attr not in self.WRITES: return fn
+
+        @functools.wraps(fn)
+        def metered(*args):
+            t0, result = time.perf_counter(), None
+            try:
+                result = fn(*args)
+                return result
+            finally:
+                ms = (time.perf_counter() - t0) * 1000
+                docs = _doc_count(attr, result)
+                with self._lock:
+                    calls, n, total = self._stats.get(attr, (0, 0, 0.0))
+                    self._stats[attr] = (calls + 1, n + docs, total + ms)
+        return metered
+
+    def stats(self):
+        with self._lock: return dict(self._stats)
+
+def store_meters(store):
+    """저장소 구성 안의 StoreMeter 목록 (CachedStore 는 primary / cache 를 따라감)"""
+    if isinstance(store, StoreMeter): return [store]
+    if isinstance(store, CachedStore): return store_meters(store.primary) + store_meters(store.cache)
+    return []
@@ -0,0 +1,95 @@
+# 스냅샷 포맷 2 (encode_snapshot / decode_snapshot) 왕복 테스트
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+from rate_core import encode_snapshot, decode_snapshot
+from rate_store import _doc_to_json, _doc_from_json
+
+ROOMS = ["FDB", "GDB", "HDP", "XYZ"]   # XYZ: ROW_MAP 밖의 객실도 그대로 보존돼야 함
+
+def make_frame(seed, days=20, start=date(2026, 12, 20), totals=None):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for i in range(days):
+        for room in ROOMS:
+            if rng.random() < 0.15: continue
+            total = totals[room] if totals else float(rng.choice([10, 20]))
+            rows.append({
+                "Date": start + timedelta(i), "RoomID": room,
+                "Available": np.nan if rng.random() < 0.1 else float(rng.integers(0, 21)),
+                "Total": total,
+                "Tag": None if rng.random() < 0.05 else str(rng.choice(["20261219", "20261220"])),
+            })
+    return pd.DataFrame(rows)
+
+def canonical(df):
+    out = df.sort_values(["Date", "RoomID"]).reset_index(drop=True)[["Date", "RoomID", "Available", "Total", "Tag"]]
+    return out.astype({"Available": float, "Total": float})
+
+def assert_same(actual, expected):
+    pd.testing.assert_frame_equal(canonical(actual), canonical(expected), check_dtype=False)
+
+def stored(doc):
+    # 저장소는 JSON (bytes 는 base64) 으로 보관하므로 그 경로까지 거쳐서 확인
+    return _doc_from_json(_doc_to_json(doc))
+
+def test_roundtrip_with_delta_prev():
+    today = make_frame(1)
+    prev = make_frame(2, days=25, start=date(2026, 12, 18))
+    doc = stored(encode_snapshot(today, prev))
+    assert "prev_delta" in doc and "prev_ref" not in doc
+    today_out, prev_out = decode_snapshot(doc)
+    assert_same(today_out, today)
+    assert_same(prev_out, prev)
+
+def test_roundtrip_with_prev_ref():
+    today, prev = make_frame(3), make_frame(4)
+    doc = stored(encode_snapshot(today, prev, prev_ref="prev-doc"))
+    assert doc["prev_ref"] == "prev-doc" and "prev_delta" not in doc
+    seen = []
+    today_out, prev_out = decode_snapshot(doc, resolve_ref=lambda doc_id: seen.append(doc_id) or prev)
+    assert seen == ["prev-doc"]
+    assert_same(today_out, today)
+    assert_same(prev_out, prev)
+    assert decode_snapshot(doc)[1].empty
+    assert decode_snapshot(doc, with_prev=False)[1].empty
+
+def test_roundtrip_without_prev():
+    today = make_frame(5)
+    doc = stored(encode_snapshot(today, pd.DataFrame()))
+    assert "prev_delta" not in doc and "prev_ref" not in doc
+    today_out, prev_out = decode_snapshot(doc)
+    assert_same(today_out, today)
+    assert prev_out.empty
+
+def test_constant_totals_are_stored_as_room_vector():
+    totals = {"FDB": 20.0, "GDB": 12.0, "HDP": 30.0, "XYZ": np.nan}
+    today = make_frame(6, totals=totals)
+    prev = make_frame(7, totals=totals)
+    doc = encode_snapshot(today, prev)
+    for enc in (doc["grid"], doc["prev_delta"]):
+        assert "total_matrix" not in enc
+        assert dict(zip(doc["grid"]["rooms"], enc["total"])) == {"FDB": 20.0, "GDB": 12.0, "HDP": 30.0, "XYZ": None}
+    today_out, prev_out = decode_snapshot(stored(doc))
+    assert_same(today_out, today)
+    assert_same(prev_out, prev)
+
+def test_varying_totals_are_stored_as_matrix():
+    today = make_frame(8)   # 날짜마다 Total 이 10 / 20 으로 바뀜
+    assert today.groupby("RoomID")["Total"].nunique().max() > 1
+    doc = encode_snapshot(today, pd.DataFrame())
+    assert "total_matrix" in doc["grid"] and "total" not in doc["grid"]
+    assert_same(decode_snapshot(stored(doc))[0], today)
+
+def test_legacy_row_documents():
+    data = [
+        {"Date": "2026-12-20", "RoomID": "FDB", "Available": 3, "Total": 20, "Tag": "20261220"},
+        {"Date": "2026-12-21", "RoomID": "GDB", "Available": None, "Total": 12, "Tag": "20261220"},
+    ]
+    prev_data = [{"Date": "2026-12-20", "RoomID": "FDB", "Available": 5, "Total": 20, "Tag": "20261219"}]
+    today_out, prev_out = decode_snapshot({"data": data, "prev_data": prev_data, "work_date": "2026-12-20"})
+    assert list(today_out["Date"]) == [date(2026, 12, 20), date(2026, 12, 21)]
+    assert list(today_out["RoomID"]) == ["FDB", "GDB"]
+    assert prev_out.loc[0, "Available"] == 5 and prev_out.loc[0, "Date"] == date(2026, 12, 20)
+    assert decode_snapshot({"data": data, "prev_data": prev_data}, with_prev=False)[1].empty
+    assert decode_snapshot({"data": data})[1].empty